@@ -3,19 +3,33 @@
 
 
 
+import atexit
 import socket
 import threading
 import json
 import ssl
+import http.client
 import time
+import random
 import argparse
 import logging
 from urllib.parse import urlparse
 import uuid
-import select
+import selectors
 import signal
 import sys
-from logging.handlers import RotatingFileHandler
+import queue
+import gc
+import os
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+# 优先使用orjson（C扩展，直接输出UTF-8字节），不可用时回退到标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # 配置日志轮转
 def setup_logging():
@@ -40,12 +54,216 @@ def setup_logging():
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # 写文件和控制台在后台线程完成，业务线程记录日志时只需放入队列，不会阻塞在文件写入和轮转上
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    
+    def stop_listener():
+        """退出时改为直接写入日志，再停止后台写日志线程，避免守护线程最后的日志丢失"""
+        # 一次性替换处理器列表：之后的日志直接写入，不会出现既不入队也无处理器的间隙
+        logger.handlers = [file_handler, console_handler]
+        # stop()会先写完队列中已有的日志
+        listener.stop()
+        # 替换前刚拿到旧处理器列表的线程可能在stop()之后才入队，这里补写
+        while True:
+            try:
+                listener.handle(log_queue.get_nowait())
+            except queue.Empty:
+                break
+    
+    atexit.register(stop_listener)
 
 # 初始化日志
 setup_logging()
 
+# 接收缓冲区池，复用预分配的bytearray，避免每次请求重新分配内存
+BUFFER_SIZE = 65536
+SOCKET_BUFFER_SIZE = 1 << 20  # 控制连接内核收发缓冲区1MB
+_buffer_pool = queue.SimpleQueue()
+
+@contextmanager
+def borrow_buffer():
+    """从缓冲区池借用一个缓冲区，使用完毕后自动归还"""
+    try:
+        buf = _buffer_pool.get_nowait()
+    except queue.Empty:
+        buf = bytearray(BUFFER_SIZE)
+    try:
+        yield buf
+    finally:
+        # 扩容过的缓冲区恢复标准大小后再归还
+        if len(buf) > BUFFER_SIZE:
+            del buf[BUFFER_SIZE:]
+        _buffer_pool.put(buf)
+
+def recv_into_buffer(sock, buf, offset):
+    """接收数据到缓冲区的offset位置，缓冲区已满时自动扩容，返回接收的字节数"""
+    if offset >= len(buf):
+        buf.extend(bytes(len(buf)))
+    return sock.recv_into(memoryview(buf)[offset:])
+
+def sendmsg_all(sock, parts):
+    """用一次sendmsg发送多段数据，处理部分发送的情况"""
+    parts = [memoryview(part) for part in parts]
+    while parts:
+        sent = sock.sendmsg(parts)
+        # 丢弃已完整发送的数据段，截断部分发送的数据段
+        done = 0
+        while done < len(parts) and sent >= len(parts[done]):
+            sent -= len(parts[done])
+            done += 1
+        del parts[:done]
+        if sent:
+            parts[0] = parts[0][sent:]
+
+if orjson:
+    def dumps_message(message):
+        """将消息序列化为以换行符结尾的字节串"""
+        return orjson.dumps(message) + b'\n'
+    
+    loads_message = orjson.loads
+else:
+    def dumps_message(message):
+        """将消息序列化为以换行符结尾的字节串"""
+        return json.dumps(message).encode('utf-8') + b'\n'
+    
+    loads_message = json.loads
+
+# 平台支持的keepalive参数设置方式
+_HAS_TCP_KEEPIDLE = hasattr(socket, 'TCP_KEEPIDLE')
+_HAS_SIO_KEEPALIVE_VALS = hasattr(socket, 'SIO_KEEPALIVE_VALS')
+
+# 重连延迟阶梯：(失败次数上限, 基础延迟秒数)，超过最后一级后固定90秒
+_RECONNECT_LADDER = ((1, 2), (2, 4), (3, 6), (4, 8), (5, 10), (15, 15), (30, 30), (60, 60))
+_RECONNECT_FINAL_DELAY = 90
+
+def next_reconnect_delay(attempt, successful_connections, since_last_success, max_delay):
+    """根据失败次数和成功连接历史计算下次重连延迟（秒），已包含随机抖动"""
+    base_delay = _RECONNECT_FINAL_DELAY
+    for max_attempt, delay in _RECONNECT_LADDER:
+        if attempt <= max_attempt:
+            base_delay = delay
+            break
+    
+    # 有成功连接历史时按距上次成功的时间调整
+    if since_last_success is not None and successful_connections > 0:
+        if since_last_success < 1800:  # 30分钟内连接成功过，快速重连
+            base_delay = min(base_delay, 10)
+        elif since_last_success < 3600:  # 1小时内连接成功过，中等延迟
+            base_delay = min(base_delay, 20)
+        elif since_last_success > 21600:  # 超过6小时没有连接成功，增加延迟
+            base_delay *= 1.5
+        
+        # 失败率超过80%时增加延迟
+        if attempt / (successful_connections + attempt) > 0.8:
+            base_delay *= 1.5
+    
+    # 等抖动：在[base_delay/2, base_delay]内随机取值，避免服务器重启后所有客户端同时重连
+    base_delay = min(base_delay, max_delay)
+    return random.uniform(base_delay * 0.5, base_delay)
+
+# 全局共享的SSL上下文，避免每次重连都重新加载系统CA证书
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.check_hostname = False
+_SSL_CTX.verify_mode = ssl.CERT_NONE
+_SSL_CTX.minimum_version = ssl.TLSVersion.TLSv1_2
+_SSL_CTX.maximum_version = ssl.TLSVersion.TLSv1_3
+
+# 逐跳头部只对单个连接有效，不能转发（RFC 7230 6.1）
+_HOP_BY_HOP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer',
+    'transfer-encoding', 'upgrade'
+})
+# 转发到本地服务时另外重写Host，Content-Length由http.client按实际请求体生成
+_REQUEST_SKIP_HEADERS = _HOP_BY_HOP_HEADERS | {'host', 'content-length'}
+# 复用连接失效时只有幂等方法自动重发，POST等请求可能已被本地服务处理过
+_IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# 固定格式的高频消息预先生成字节模板，只需填入时间戳和计数，无需每次序列化字典
+_HEARTBEAT_TEMPLATE = b'{"type":"heartbeat","timestamp":%.6f,"count":%d}\n'
+_HEARTBEAT_RESPONSE_TEMPLATE = b'{"type":"heartbeat_response","timestamp":%.6f,"original_timestamp":%b}\n'
+_PONG_TEMPLATE = b'{"type":"pong","timestamp":%.6f,"original_timestamp":%b}\n'
+
+_RESPONSE_CHUNK_TEMPLATE = b'{"type":"response_chunk","request_id":%b,"seq":%d,"length":%d,"final":%b}\n'
+
+# 同一位置每秒最多记录一次完整堆栈，错误风暴时不反复格式化traceback
+_TRACEBACK_INTERVAL = 1.0
+_last_traceback_times = {}
+
+def traceback_allowed(site):
+    """判断该位置这次是否记录完整堆栈，用作exc_info的值"""
+    now = time.monotonic()
+    if now - _last_traceback_times.get(site, float('-inf')) < _TRACEBACK_INTERVAL:
+        return False
+    _last_traceback_times[site] = now
+    return True
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_statm_fd = None  # /proc/self/statm的文件描述符，首次使用时打开；-1表示不可用
+_statm_lock = threading.Lock()
+
+def _close_statm():
+    """退出时关闭保持打开的/proc/self/statm"""
+    global _statm_fd
+    with _statm_lock:
+        if _statm_fd is not None and _statm_fd >= 0:
+            try:
+                os.close(_statm_fd)
+            except OSError:
+                pass
+        _statm_fd = -1
+
+def current_rss_mb():
+    """读取当前进程的常驻内存（MB），不支持/proc或读取失败时返回None"""
+    global _statm_fd
+    with _statm_lock:
+        if _statm_fd is None:
+            # 首次使用时打开并保持打开，之后每次用pread从头读取，不必重复open/close
+            try:
+                _statm_fd = os.open('/proc/self/statm', os.O_RDONLY)
+                atexit.register(_close_statm)
+            except OSError:
+                _statm_fd = -1
+        if _statm_fd < 0:
+            return None
+        try:
+            # statm第二个字段是常驻内存页数
+            return int(os.pread(_statm_fd, 64, 0).split()[1]) * _PAGE_SIZE / (1024 * 1024)
+        except (OSError, ValueError, IndexError, AttributeError):
+            # 读取失败（如/proc被卸载）后关闭并不再尝试，调用方改用其他方式
+            try:
+                os.close(_statm_fd)
+            except OSError:
+                pass
+            _statm_fd = -1
+            return None
+
+def encode_json_value(value):
+    """将单个值编码为JSON字节，用于填充字节模板"""
+    return json.dumps(value).encode('ascii')
+
+class LocalHTTPConnection(http.client.HTTPConnection):
+    """到本地服务的HTTP连接，请求头和请求体合并为一次发送"""
+    
+    def _send_output(self, message_body=None, encode_chunked=False):
+        if not isinstance(message_body, (bytes, bytearray)):
+            super()._send_output(message_body, encode_chunked)
+            return
+        
+        self._buffer.extend((b"", b""))
+        header = b"\r\n".join(self._buffer)
+        del self._buffer[:]
+        
+        if len(message_body) > BUFFER_SIZE and hasattr(self.sock, 'sendmsg'):
+            # 较大的请求体用sendmsg与请求头一起聚合写出，无需拷贝拼接
+            sendmsg_all(self.sock, [header, message_body])
+        else:
+            # 较小的请求体直接拼接在请求头之后，避免两次send及Nagle算法带来的延迟
+            self.send(header + message_body)
+
 # 设置Windows环境下的标准输出编码为UTF-8
 if hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8')
@@ -67,18 +285,53 @@ class TunnelClient:
         self.use_ssl = use_ssl
         self.running = False
         self.control_socket = None
-        self.reconnect_delay = 2  # 初始重连延迟2秒
         self.max_reconnect_delay = 300  # 最大重连延迟5分钟
         self.reconnect_attempts = 0  # 重连尝试次数
         self.max_reconnect_attempts = 999  # 无限重连
         self.successful_connections = 0  # 成功连接次数
         self.last_successful_time = None  # 最后一次成功连接时间
-        self.last_heartbeat_received = time.time()  # 最后收到心跳的时间
+        self.last_heartbeat_received = time.monotonic()  # 最后收到心跳的时间（单调时钟）
+        self.last_message_time = time.monotonic()  # 最后收到服务器数据的时间（单调时钟）
         self.heartbeat_timeout = 90  # 心跳超时时间降到90秒
+        self.stable_connection_time = self.heartbeat_timeout / 2  # 连接保持这么久才算稳定，之后才重置重连计数
+        self.memory_growth_threshold = 50  # 常驻内存比上次回收后增长超过50MB才主动执行完整回收
+        self._last_memory_mb = 0.0  # 启动或上次主动回收后的常驻内存
+        self.gc_collections = [0, 0, 0]  # 各代回收次数，由gc回调统计
         self.heartbeat_thread = None
         self.message_handler_thread = None
+        self.writer_thread = None
+        self.send_queue = queue.Queue()  # 发送队列，每次连接时重新创建
         self.connection_lock = threading.Lock()  # 连接锁
         self.shutdown_event = threading.Event()  # 优雅关闭事件
+        self._registered = threading.Event()  # 收到服务器注册确认
+        self._disconnected = threading.Event()  # 任一工作线程退出时置位
+        self._tls_session = None  # 上次连接的TLS会话，用于重连时会话复用
+        # 唤醒消息处理线程用的socket对，断开或关闭时可立即中断等待
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self.max_concurrent_requests = 32  # 同时处理的最大请求数
+        # 到本地服务的keep-alive连接池（后进先出，优先复用最近使用的连接）
+        self.local_connection_pool = queue.LifoQueue(maxsize=self.max_concurrent_requests)
+        self.local_idle_timeout = 15  # 池中连接空闲超过15秒不再复用
+        self.max_queued_requests = 64  # 线程池满时允许排队等待的请求数
+        # 正在处理和排队的请求名额，用完后新请求直接返回503
+        self.request_slots = threading.BoundedSemaphore(self.max_concurrent_requests + self.max_queued_requests)
+        # 请求处理线程池，复用线程而不是每个请求新建线程
+        self.request_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_requests,
+            thread_name_prefix="tunnel-req"
+        )
+        
+        # 消息类型到处理方法的分发表
+        self._message_handlers = {
+            "request": self._on_request,
+            "register_confirm": self._on_register_confirm,
+            "heartbeat": self._on_heartbeat,
+            "heartbeat_response": self._on_heartbeat_response,
+            "ping": self._on_ping,
+            "pong": self._on_pong,
+        }
         
         # 注册信号处理器
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -93,6 +346,12 @@ class TunnelClient:
         self.running = True
         self.shutdown_event.clear()
         logging.info("客户端启动中...")
+        # 每个请求都会产生大量短命的dict/bytes，默认阈值(700)下第0代回收过于频繁
+        gc.set_threshold(10000, 15, 15)
+        gc.callbacks.append(self._on_gc)
+        # 启动时创建的长期对象移出分代回收，后续回收不再反复扫描它们
+        gc.freeze()
+        self._last_memory_mb = current_rss_mb() or 0.0
         self.connect_to_server()
         
     def connect_to_server(self):
@@ -111,66 +370,45 @@ class TunnelClient:
                     # 创建到服务器的控制连接
                     logging.info(f"正在连接到服务器 {self.server_host}:{self.server_port}...")
                     
-                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    
-                    # 设置socket选项提高稳定性
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                    
-                    # 设置keepalive参数（Windows兼容）
-                    if hasattr(socket, 'TCP_KEEPIDLE'):
-                        try:
-                            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
-                            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5)
-                            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
-                        except OSError:
-                            # Windows上可能不支持这些选项
-                            pass
-                    
-                    sock.settimeout(30)  # 连接超时30秒
-                    
                     try:
-                        if self.use_ssl:
-                            # 创建SSL上下文
-                            context = ssl.create_default_context()
-                            context.check_hostname = False
-                            context.verify_mode = ssl.CERT_NONE
-                            context.minimum_version = ssl.TLSVersion.TLSv1_2
-                            context.maximum_version = ssl.TLSVersion.TLSv1_3
-                            # 包装为SSL连接
-                            sock = context.wrap_socket(sock, server_hostname=self.server_host)
-                        
-                        # 尝试连接
-                        sock.connect((self.server_host, self.server_port))
+                        sock = self._open_control_socket()
                         
-                        # 连接成功后设置socket参数（Windows兼容）
-                        if hasattr(socket, 'TCP_KEEPIDLE'):
+                        if self.use_ssl:
+                            # 包装为SSL连接（socket已连接，包装时即完成握手）
+                            # 带上上次连接的TLS会话，服务器支持时可以跳过完整握手
                             try:
-                                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
-                                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
-                                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 6)
-                            except OSError:
-                                # Windows上可能不支持这些选项
-                                pass
+                                sock = _SSL_CTX.wrap_socket(
+                                    sock,
+                                    server_hostname=self.server_host,
+                                    session=self._tls_session
+                                )
+                            except:
+                                sock.close()
+                                raise
                         
                         logging.info("成功连接到服务器")
+                        if self.use_ssl:
+                            logging.info(f"TLS会话复用: {'是' if sock.session_reused else '否'}")
                         
                         # 连接成功后重置超时设置
                         sock.settimeout(None)
                         self.control_socket = sock
                         
-                        # 发送注册信息
+                        # 每个连接使用新的断开事件，旧连接遗留的线程不会影响新连接
+                        self._disconnected = threading.Event()
+                        
+                        # 先启动写线程和消息处理线程，才能发送注册消息并收到注册确认
+                        self._start_writer_thread()
+                        self._start_message_handler_thread()
+                        
+                        # 发送注册信息并等待服务器确认
                         if not self._register_with_server():
-                            logging.error("注册失败，重新连接")
-                            continue
+                            raise ConnectionError("注册失败")
                         
-                        # 连接成功，重置重连参数并记录成功连接
+                        # 连接成功，记录成功连接（重连计数等连接稳定后再重置）
                         self.successful_connections += 1
-                        self.last_successful_time = time.time()
-                        self.reconnect_delay = 2
-                        self.reconnect_attempts = 0
-                        self.last_heartbeat_received = time.time()
+                        self.last_successful_time = time.monotonic()
+                        self.last_heartbeat_received = self.last_message_time = time.monotonic()
                         logging.info(f"连接成功 (第{self.successful_connections}次成功连接)")
                         
                         # 输出当前状态信息
@@ -181,14 +419,11 @@ class TunnelClient:
                         # 启动心跳线程
                         self._start_heartbeat_thread()
                         
-                        # 启动消息处理线程
-                        self._start_message_handler_thread()
-                        
                         # 等待连接断开
                         self._wait_for_disconnection()
                         
                     except (socket.error, ssl.SSLError) as e:
-                        logging.error(f"连接失败: {e}")
+                        logging.error("连接失败: %s", e)
                         if self.control_socket:
                             try:
                                 self.control_socket.close()
@@ -198,7 +433,7 @@ class TunnelClient:
                         
                         
             except Exception as e:
-                logging.error(f"连接过程错误: {e}")
+                logging.error("连接过程错误: %s", e)
                 
             finally:
                 self._cleanup_connection()
@@ -207,13 +442,66 @@ class TunnelClient:
             if self.running and not self.shutdown_event.is_set():
                 self.reconnect_attempts += 1
                 
-                # 智能重连算法
-                current_delay = self._calculate_reconnect_delay()
+                # 智能重连算法（已包含随机抖动）
+                since_last_success = None
+                if self.last_successful_time is not None:
+                    since_last_success = time.monotonic() - self.last_successful_time
+                current_delay = next_reconnect_delay(
+                    self.reconnect_attempts,
+                    self.successful_connections,
+                    since_last_success,
+                    self.max_reconnect_delay
+                )
                 
-                logging.info(f"第 {self.reconnect_attempts} 次重连失败，将在 {current_delay} 秒后重试")
+                logging.info(f"第 {self.reconnect_attempts} 次重连失败，将在 {current_delay:.1f} 秒后重试")
                 if self.shutdown_event.wait(current_delay):
                     break  # 收到关闭信号
     
+    def _open_control_socket(self):
+        """解析服务器地址，按getaddrinfo返回的顺序依次尝试（支持IPv6/IPv4双栈），返回已连接的socket"""
+        last_error = None
+        for family, sock_type, proto, _, address in socket.getaddrinfo(
+                self.server_host, self.server_port, 0, socket.SOCK_STREAM):
+            sock = socket.socket(family, sock_type, proto)
+            try:
+                self._apply_sockopts(sock)
+                sock.settimeout(30)  # 连接超时30秒
+                sock.connect(address)
+                return sock
+            except OSError as e:
+                logging.debug("连接 %s 失败: %s", address, e)
+                last_error = e
+                sock.close()
+        raise last_error or OSError(f"无法解析服务器地址: {self.server_host}")
+    
+    def _apply_sockopts(self, sock):
+        """设置控制连接的socket选项，需在connect前调用"""
+        # 设置socket选项提高稳定性
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        # 增大内核收发缓冲区（需在connect前设置才能影响TCP窗口协商）
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        except OSError:
+            pass
+        
+        # 禁用Nagle算法，心跳和小响应立即发出（写线程已负责合并批量发送）
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
+        # keepalive：空闲20秒开始探测，每5秒一次，3次无响应判定断开
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if _HAS_TCP_KEEPIDLE:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 20)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+            elif _HAS_SIO_KEEPALIVE_VALS:
+                # Windows通过ioctl设置，单位为毫秒
+                sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 20000, 5000))
+        except OSError:
+            pass
+    
     def _register_with_server(self):
         """向服务器注册"""
         try:
@@ -226,25 +514,30 @@ class TunnelClient:
             if self.subdomain:
                 registration["subdomain"] = self.subdomain
             
-            registration_json = json.dumps(registration) + '\n'
             logging.info(f"发送注册消息: {registration}")
             
-            self.control_socket.sendall(registration_json.encode('utf-8'))
+            self._registered.clear()
+            if not self._send_message_safe(registration):
+                return False
             logging.info("注册消息已发送，等待服务器响应...")
             
-            # 等待一下确保注册处理完成
-            time.sleep(1)
+            # 等待服务器的注册确认，而不是固定休眠
+            if not self._registered.wait(5):
+                logging.error("5秒内未收到服务器的注册确认")
+                return False
             return True
             
         except Exception as e:
-            logging.error(f"注册失败: {e}")
+            logging.error("注册失败: %s", e)
             return False
     
     def _start_heartbeat_thread(self):
         """启动心跳线程"""
         if self.heartbeat_thread and self.heartbeat_thread.is_alive():
             return
-            
+        
+        disconnected = self._disconnected
+        
         def heartbeat_worker():
             heartbeat_interval = 15  # 15秒发送一次心跳（提高检测频率）
             heartbeat_count = 0
@@ -253,22 +546,24 @@ class TunnelClient:
             
             while self.running and not self.shutdown_event.is_set() and self.control_socket:
                 try:
-                    # 检查心跳超时
-                    current_time = time.time()
-                    if current_time - self.last_heartbeat_received > 45:  # 45秒心跳超时
-                        logging.warning(f"心跳超时，最后心跳时间: {self.last_heartbeat_received}, 当前时间: {current_time}")
+                    # 看门狗：45秒内没有收到服务器的任何数据，主动关闭连接触发重连
+                    silence = time.monotonic() - self.last_message_time
+                    if silence > 45:
+                        logging.warning("已有%.0f秒未收到服务器数据，关闭连接", silence)
+                        try:
+                            self.control_socket.shutdown(socket.SHUT_RDWR)
+                        except (OSError, AttributeError):
+                            pass
                         break
                     
+                    current_time = time.time()
+                    
                     # 发送心跳
                     heartbeat_count += 1
-                    heartbeat = {
-                        "type": "heartbeat", 
-                        "timestamp": current_time,
-                        "count": heartbeat_count
-                    }
+                    heartbeat = _HEARTBEAT_TEMPLATE % (current_time, heartbeat_count)
                     
-                    if self._send_message_safe(heartbeat):
-                        logging.debug(f"发送心跳消息 #{heartbeat_count}")
+                    if self._send_frame_safe(heartbeat):
+                        logging.debug("发送心跳消息 #%s", heartbeat_count)
                     else:
                         logging.error("心跳发送失败")
                         break
@@ -282,10 +577,11 @@ class TunnelClient:
                         break
                         
                 except Exception as e:
-                    logging.error(f"心跳线程错误: {e}")
+                    logging.error("心跳线程错误: %s", e)
                     break
             
             logging.info("心跳线程结束")
+            disconnected.set()  # 通知主循环连接已断开
         
         self.heartbeat_thread = threading.Thread(target=heartbeat_worker)
         self.heartbeat_thread.daemon = True
@@ -295,74 +591,175 @@ class TunnelClient:
         """启动消息处理线程"""
         if self.message_handler_thread and self.message_handler_thread.is_alive():
             return
-            
+        
+        disconnected = self._disconnected
+        
         def message_handler_worker():
             logging.info("消息处理线程启动")
-            buffer = b''
             
-            while self.running and not self.shutdown_event.is_set() and self.control_socket:
-                try:
-                    # 使用select检查socket可读性
-                    ready, _, error = select.select([self.control_socket], [], [self.control_socket], 1)
-                    
-                    if error:
-                        logging.error("Socket出现错误")
-                        break
-                    
-                    if not ready:
-                        continue  # 超时，继续循环
-                    
-                    # 接收数据
-                    data = self.control_socket.recv(4096)
-                    
-                    if not data:
-                        logging.warning("服务器连接已关闭")
-                        break
-                    
-                    buffer += data
+            # 丢弃上一个连接遗留的唤醒信号
+            self._drain_wakeup()
+            
+            sock = self.control_socket
+            selector = selectors.DefaultSelector()
+            
+            try:
+                selector.register(sock, selectors.EVENT_READ)
+                selector.register(self._wakeup_reader, selectors.EVENT_READ)
+                
+                with borrow_buffer() as buffer:
+                    start = 0  # 未处理数据的起始位置
+                    raw_message = None  # 正在等待原始数据的消息头
+                    payload = payload_view = None  # 原始数据单独接收到按length分配的bytearray中
+                    filled = 0  # 原始数据已接收的字节数
+                    buffered = 0  # 缓冲区中已接收数据的结束位置
                     
-                    # 处理可能的多条消息
-                    while b'\n' in buffer:
-                        message, buffer = buffer.split(b'\n', 1)
-                        if message:
-                            try:
-                                self.process_message(message.decode('utf-8'))
-                            except Exception as e:
-                                logging.error(f"处理单条消息错误: {e}")
-                                continue
+                    while self.running and not self.shutdown_event.is_set() and self.control_socket:
+                        try:
+                            # SSL层可能已缓存了解密后的数据，此时无需等待socket可读
+                            if not (isinstance(sock, ssl.SSLSocket) and sock.pending()):
+                                # 无超时阻塞等待，断开和关闭都会通过唤醒socket中断等待
+                                events = selector.select()
+                                
+                                if any(key.fileobj is self._wakeup_reader for key, _ in events):
+                                    logging.debug("消息处理线程被唤醒，准备退出")
+                                    break
                             
-                except Exception as e:
-                    logging.error(f"接收消息错误: {e}")
-                    break
+                            if payload is not None and start == buffered:
+                                # 缓冲区已取空，原始数据的剩余部分直接接收到payload中，不为大请求体扩容缓冲区
+                                received = sock.recv_into(payload_view[filled:])
+                                filled += received
+                            else:
+                                # 已处理的数据超过一半或缓冲区已满时，才把剩余数据前移，分摊移动开销
+                                if start and (start >= len(buffer) // 2 or buffered >= len(buffer)):
+                                    buffer[:buffered - start] = buffer[start:buffered]
+                                    buffered -= start
+                                    start = 0
+                                
+                                # 直接接收到缓冲区，避免每次recv分配新对象
+                                received = recv_into_buffer(sock, buffer, buffered)
+                                buffered += received
+                            
+                            if not received:
+                                logging.warning("服务器连接已关闭")
+                                break
+                            
+                            self.last_message_time = time.monotonic()
+                            
+                            # 处理可能的多条消息，每条消息只扫描一次
+                            while True:
+                                if raw_message is not None:
+                                    # 消息头之后紧跟length字节的原始数据：先取缓冲区中已有的部分，收齐后再处理
+                                    take = min(buffered - start, len(payload) - filled)
+                                    if take:
+                                        payload_view[filled:filled + take] = memoryview(buffer)[start:start + take]
+                                        filled += take
+                                        start += take
+                                    if filled < len(payload):
+                                        break
+                                    payload_view.release()
+                                    raw_message["payload"] = payload
+                                    message, raw_message = raw_message, None
+                                    payload = payload_view = None
+                                else:
+                                    newline = buffer.find(b'\n', start, buffered)
+                                    if newline < 0:
+                                        break
+                                    line = buffer[start:newline]
+                                    start = newline + 1
+                                    if not line:
+                                        continue
+                                    
+                                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                                        logging.debug("处理消息: %s", bytes(line[:200]))
+                                    try:
+                                        message = loads_message(line)
+                                    except ValueError as e:
+                                        logging.error("JSON解析错误: %s, 消息内容: %r", e, bytes(line[:200]))
+                                        continue
+                                    if not isinstance(message, dict):
+                                        # 合法JSON但不是对象（如[]、1），跳过该行，不影响整个隧道
+                                        logging.error("消息不是JSON对象，已忽略: %r", bytes(line[:200]))
+                                        continue
+                                    if message.get("length"):
+                                        raw_message = message
+                                        payload = bytearray(message["length"])
+                                        payload_view = memoryview(payload)
+                                        filled = 0
+                                        continue
+                                
+                                try:
+                                    self.process_message(message)
+                                except Exception as e:
+                                    logging.error("处理单条消息错误: %s", e, exc_info=traceback_allowed("message"))
+                                # 不再引用已分发的消息，请求体在请求线程处理完后即可释放
+                                message = None
+                            
+                            # 数据已全部处理完，直接从缓冲区开头继续接收
+                            if start == buffered:
+                                start = buffered = 0
+                                    
+                        except Exception as e:
+                            logging.error("接收消息错误: %s", e)
+                            break
+            except Exception as e:
+                logging.error("消息处理线程错误: %s", e)
+            finally:
+                selector.close()
             
             logging.info("消息处理线程结束")
+            disconnected.set()  # 通知主循环连接已断开
         
         self.message_handler_thread = threading.Thread(target=message_handler_worker)
         self.message_handler_thread.daemon = True
         self.message_handler_thread.start()
     
     def _wait_for_disconnection(self):
-        """等待连接断开"""
+        """等待连接断开：任一工作线程退出时立即返回"""
         while self.running and not self.shutdown_event.is_set() and self.control_socket:
-            # 检查线程状态
-            if self.heartbeat_thread and not self.heartbeat_thread.is_alive():
-                logging.warning("心跳线程已停止")
-                break
-                
-            if self.message_handler_thread and not self.message_handler_thread.is_alive():
-                logging.warning("消息处理线程已停止")
+            # 重连计数未重置时缩短等待，连接稳定后及时重置
+            timeout = self.stable_connection_time if self.reconnect_attempts else self.heartbeat_timeout
+            if self._disconnected.wait(timeout):
+                logging.warning("工作线程已停止，连接断开")
                 break
             
             # 检查心跳超时
-            if time.time() - self.last_heartbeat_received > self.heartbeat_timeout:
+            if time.monotonic() - self.last_heartbeat_received > self.heartbeat_timeout:
                 logging.warning("心跳超时，准备重连")
                 break
             
-            time.sleep(5)
+            # 刚注册成功就断开的连接不重置计数，反复断开时重连延迟会继续增加
+            if self.reconnect_attempts and time.monotonic() - self.last_successful_time >= self.stable_connection_time:
+                logging.info(f"连接已稳定{int(self.stable_connection_time)}秒，重置重连计数")
+                self.reconnect_attempts = 0
+    
+    def _wakeup_message_handler(self):
+        """唤醒正在等待数据的消息处理线程"""
+        try:
+            self._wakeup_writer.send(b'\x00')
+        except OSError:
+            pass  # 已有未处理的唤醒信号或socket已关闭
+    
+    def _drain_wakeup(self):
+        """清空遗留的唤醒信号"""
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            pass
     
     def _cleanup_connection(self):
         """清理连接资源"""
+        self._wakeup_message_handler()
+        self._stop_writer_thread()
+        
         if self.control_socket:
+            # TLS 1.3的会话票据在握手之后才到达，关闭前保存会话供下次重连复用
+            if isinstance(self.control_socket, ssl.SSLSocket):
+                try:
+                    self._tls_session = self.control_socket.session or self._tls_session
+                except (OSError, ValueError):
+                    pass
             try:
                 self.control_socket.close()
             except:
@@ -375,241 +772,328 @@ class TunnelClient:
             
         if self.message_handler_thread and self.message_handler_thread.is_alive():
             self.message_handler_thread.join(timeout=2)
+        
+        if self.writer_thread and self.writer_thread.is_alive():
+            self.writer_thread.join(timeout=2)
     
-    def _send_message_safe(self, message):
-        """安全地发送消息到服务器"""
+    def _send_message_safe(self, message, raw_data=None):
+        """安全地发送消息到服务器，raw_data为紧跟在消息头之后的原始字节"""
         try:
-            if not self.control_socket:
-                return False
-            
-            message_json = json.dumps(message)
-            if not message_json.endswith('\n'):
-                message_json += '\n'
-            
-            self.control_socket.sendall(message_json.encode('utf-8'))
-            return True
+            payload = dumps_message(message)
         except Exception as e:
-            logging.error(f"发送消息错误: {e}")
+            logging.error("序列化消息错误: %s", e)
             return False
+        return self._send_frame_safe(payload, raw_data)
+    
+    def _send_frame_safe(self, payload, raw_data=None):
+        """将已编码的消息字节放入发送队列，由写线程统一发送到服务器"""
+        send_queue = self.send_queue
+        # 消息头和原始字节作为一项入队，保证连续写出
+        frame = (payload, bytes(raw_data)) if raw_data else (payload,)
+        
+        # 队列已满时阻塞等待，形成背压；连接断开则放弃
+        while self.control_socket and self.writer_thread and self.writer_thread.is_alive():
+            try:
+                send_queue.put(frame, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _start_writer_thread(self):
+        """启动写线程，独占控制连接的发送，并把排队的多条消息合并为一次系统调用"""
+        sock = self.control_socket
+        send_queue = self.send_queue = queue.Queue(maxsize=256)
+        disconnected = self._disconnected
+        
+        def writer_worker():
+            logging.info("写线程启动")
+            # SSL连接不支持sendmsg，合并后用sendall发送
+            use_sendmsg = hasattr(sock, 'sendmsg') and not isinstance(sock, ssl.SSLSocket)
+            
+            while True:
+                frame = send_queue.get()
+                if frame is None:
+                    break
+                
+                # 取出当前排队的所有消息（最多64条），一起发送
+                parts = list(frame)
+                stopping = False
+                for _ in range(63):
+                    try:
+                        frame = send_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if frame is None:
+                        stopping = True
+                        break
+                    parts.extend(frame)
+                
+                try:
+                    if use_sendmsg:
+                        sendmsg_all(sock, parts)
+                    else:
+                        sock.sendall(b''.join(parts))
+                except Exception as e:
+                    logging.error("发送消息错误: %s", e)
+                    break
+                
+                if stopping:
+                    break
+            
+            logging.info("写线程结束")
+            disconnected.set()  # 通知主循环连接已断开
+        
+        self.writer_thread = threading.Thread(target=writer_worker)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+    
+    def _stop_writer_thread(self):
+        """通知写线程退出"""
+        try:
+            self.send_queue.put_nowait(None)
+        except queue.Full:
+            pass  # 写线程正忙于发送，socket关闭后会自行退出
     
     def send_message(self, message):
         """安全地发送消息到服务器（向后兼容）"""
         return self._send_message_safe(message)
     
-    def process_message(self, message_str):
+    def process_message(self, message):
         try:
-            logging.debug(f"处理消息: {message_str.strip()}")
-            message = json.loads(message_str)
             message_type = message.get("type")
-            
-            if message_type == "request":
-                # 启动新线程处理请求
-                logging.info(f"收到请求: {message['request_id']}")
-                threading.Thread(
-                    target=self.handle_request, 
-                    args=(message["request_id"], message["data"])
-                ).start()
-            elif message_type == "heartbeat":
-                # 处理服务器发送的心跳消息
-                logging.debug(f"收到服务器心跳消息，时间戳: {message.get('timestamp', 'N/A')}")
-                self.last_heartbeat_received = time.time() # 更新最后收到心跳的时间
-                # 发送心跳响应
-                heartbeat_response = {
-                    "type": "heartbeat_response",
-                    "timestamp": time.time(),
-                    "original_timestamp": message.get('timestamp')
-                }
-                self.send_message(heartbeat_response)
-                logging.debug("发送心跳响应到服务器")
-            elif message_type == "heartbeat_response":
-                # 处理服务器的心跳响应
-                server_time = message.get('server_time', 'N/A')
-                server_timestamp = message.get('timestamp', 'N/A')
-                self.last_heartbeat_received = time.time() # 更新最后收到心跳的时间
-                logging.debug(f"收到服务器心跳响应，服务器时间: {server_time}，时间戳: {server_timestamp}")
-            elif message_type == "ping":
-                # 处理服务器的ping消息
-                ping_timestamp = message.get('timestamp', 'N/A')
-                self.last_heartbeat_received = time.time() # 更新最后收到心跳的时间
-                logging.debug(f"收到服务器ping消息，时间戳: {ping_timestamp}")
-                # 发送pong响应
-                pong_response = {
-                    "type": "pong",
-                    "timestamp": time.time(),
-                    "original_timestamp": ping_timestamp
-                }
-                self.send_message(pong_response)
-                logging.debug(f"发送pong响应到服务器，原始时间戳: {ping_timestamp}")
-            elif message_type == "pong":
-                # 处理服务器的pong响应
-                original_timestamp = message.get('original_timestamp', 'N/A')
-                response_timestamp = message.get('timestamp', 'N/A')
-                self.last_heartbeat_received = time.time() # 更新最后收到心跳的时间
-                if original_timestamp != 'N/A' and response_timestamp != 'N/A':
-                    try:
-                        rtt = float(response_timestamp) - float(original_timestamp)
-                        logging.info(f"收到服务器pong响应，往返时间: {rtt:.3f}秒")
-                    except:
-                        logging.debug(f"收到服务器pong响应，原始时间戳: {original_timestamp}")
-                else:
-                    logging.debug("收到服务器pong响应")
+            handler = self._message_handlers.get(message_type)
+            if handler:
+                handler(message)
             else:
-                logging.warning(f"收到未知类型的消息: {message_type}")
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON解析错误: {e}, 消息内容: {message_str}")
+                logging.warning("收到未知类型的消息: %s", message_type)
         except Exception as e:
-            logging.error(f"处理消息错误: {e}")
+            logging.error("处理消息错误: %s", e, exc_info=traceback_allowed("process_message"))
     
-    def handle_request(self, request_id, data):
-        local_socket = None
-        start_time = time.time()
+    def _on_request(self, message):
+        """处理服务器转发的HTTP请求"""
+        request_id = message["request_id"]
+        logging.debug("收到请求: %s", request_id)
+        
+        # 积压的请求过多时立即拒绝，避免无限排队
+        if not self.request_slots.acquire(blocking=False):
+            logging.warning("待处理请求过多，拒绝请求: %s", request_id)
+            self.send_error_response(request_id, "客户端繁忙，请稍后重试", status=503)
+            return
+        
+        # 提交到线程池处理请求，完成后归还名额
+        future = self.request_executor.submit(
+            self.handle_request,
+            request_id,
+            message["data"],
+            message.get("payload", b'')
+        )
+        future.add_done_callback(lambda _: self.request_slots.release())
+    
+    def _on_register_confirm(self, message):
+        """处理服务器的注册确认"""
+        logging.info("收到服务器注册确认，隧道ID: %s", message.get('tunnel_id'))
+        self._registered.set()
+    
+    def _on_heartbeat(self, message):
+        """处理服务器发送的心跳消息"""
+        logging.debug("收到服务器心跳消息，时间戳: %s", message.get('timestamp', 'N/A'))
+        self.last_heartbeat_received = time.monotonic() # 更新最后收到心跳的时间
+        # 发送心跳响应
+        self._send_frame_safe(_HEARTBEAT_RESPONSE_TEMPLATE % (
+            time.time(), encode_json_value(message.get('timestamp'))))
+        logging.debug("发送心跳响应到服务器")
+    
+    def _on_heartbeat_response(self, message):
+        """处理服务器的心跳响应"""
+        server_time = message.get('server_time', 'N/A')
+        server_timestamp = message.get('timestamp', 'N/A')
+        self.last_heartbeat_received = time.monotonic() # 更新最后收到心跳的时间
+        logging.debug("收到服务器心跳响应，服务器时间: %s，时间戳: %s", server_time, server_timestamp)
+    
+    def _on_ping(self, message):
+        """处理服务器的ping消息"""
+        ping_timestamp = message.get('timestamp', 'N/A')
+        self.last_heartbeat_received = time.monotonic() # 更新最后收到心跳的时间
+        logging.debug("收到服务器ping消息，时间戳: %s", ping_timestamp)
+        # 发送pong响应
+        self._send_frame_safe(_PONG_TEMPLATE % (
+            time.time(), encode_json_value(message.get('timestamp'))))
+        logging.debug("发送pong响应到服务器，原始时间戳: %s", ping_timestamp)
+    
+    def _on_pong(self, message):
+        """处理服务器的pong响应"""
+        original_timestamp = message.get('original_timestamp', 'N/A')
+        response_timestamp = message.get('timestamp', 'N/A')
+        self.last_heartbeat_received = time.monotonic() # 更新最后收到心跳的时间
+        if original_timestamp != 'N/A' and response_timestamp != 'N/A':
+            try:
+                rtt = float(response_timestamp) - float(original_timestamp)
+                logging.info("收到服务器pong响应，往返时间: %.3f秒", rtt)
+            except:
+                logging.debug("收到服务器pong响应，原始时间戳: %s", original_timestamp)
+        else:
+            logging.debug("收到服务器pong响应")
+    
+    def handle_request(self, request_id, data, body=b''):
+        conn = None
+        reusable = False
+        start_time = time.monotonic()
         
         try:
-            # 确保data是字典类型
-            if isinstance(data, str):
-                try:
-                    data = json.loads(data)
-                except json.JSONDecodeError:
-                    data = {
-                        "method": "GET",
-                        "path": "/",
-                        "headers": {},
-                        "body": ""
-                    }
-            
             method = data.get('method', 'GET')
             path = data.get('path', '/')
             headers = data.get('headers', {})
-            body = data.get('body', '')
-            
-            # 连接到本地服务
-            logging.info(f"连接本地服务 {self.local_host}:{self.local_port}")
-            local_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            local_socket.settimeout(30)  # 连接超时30秒
-            local_socket.connect((self.local_host, self.local_port))
-            
-            # 连接成功后设置更长的数据传输超时
-            local_socket.settimeout(300)  # 5分钟数据传输超时
-            
-            # 构建HTTP请求
-            request_str = f"{method} {path} HTTP/1.1\r\n"
-            request_str += f"Host: {self.local_host}:{self.local_port}\r\n"
             
             # 添加原始请求的头部
-            for name, value in headers.items():
-                if name.lower() not in ['host', 'connection', 'content-length']:
-                    request_str += f"{name}: {value}\r\n"
-            
-            request_str += "Connection: close\r\n"
-            
-            # 正确设置Content-Length
-            if body:
-                body_bytes = body.encode('utf-8') if isinstance(body, str) else body
-                request_str += f"Content-Length: {len(body_bytes)}\r\n"
-            
-            request_str += "\r\n"
-            
-            if body:
-                if isinstance(body, str):
-                    request_str += body
-                else:
-                    local_socket.sendall(request_str.encode('utf-8'))
-                    local_socket.sendall(body)
-                    request_str = ""
-            
-            # 发送请求到本地爬虫服务
-            if request_str:
-                local_socket.sendall(request_str.encode('utf-8'))
+            request_headers = {
+                name: value for name, value in headers.items()
+                if name.lower() not in _REQUEST_SKIP_HEADERS
+            }
+            request_headers["Host"] = f"{self.local_host}:{self.local_port}"
+            request_headers["Connection"] = "keep-alive"  # 保持连接以便复用
             
             # 通知服务器开始爬虫任务
             self.send_progress_update(request_id, "开始爬虫任务")
             
-            # 接收响应
-            logging.info(f"等待本地服务响应")
-            response = b""
-            last_progress_time = time.time()
-            timeout_count = 0
-            max_timeouts = 10  # 最多允许10次超时
+            # 从连接池获取到本地服务的连接并发送请求，等待响应头
+            conn, reused = self._acquire_local_connection()
+            try:
+                local_response = self._send_local_request(conn, method, path, body, request_headers)
+            except ConnectionError as e:
+                if not reused or method.upper() not in _IDEMPOTENT_METHODS:
+                    raise
+                # 池中的空闲连接可能已被本地服务关闭，新建连接重试一次
+                logging.debug("复用的本地连接已失效: %s，新建连接重试", e)
+                conn.close()
+                conn, reused = self._acquire_local_connection(fresh=True)
+                local_response = self._send_local_request(conn, method, path, body, request_headers)
             
-            while True:
-                try:
-                    current_time = time.time()
-                    elapsed = int(current_time - start_time)
-                    
-                    # 每30秒发送一次进度更新
-                    if current_time - last_progress_time > 30:
-                        data_received = len(response)
-                        self.send_progress_update(request_id, 
-                            f"任务运行中... 已耗时{elapsed}秒，已接收数据{data_received}字节")
-                        last_progress_time = current_time
-                    
-                    # 检查总运行时间
-                    if elapsed > 600:  # 10分钟总超时
-                        logging.warning(f"任务总超时，已运行{elapsed}秒")
-                        self.send_progress_update(request_id, f"任务总超时，已运行{elapsed}秒")
-                        break
-                    
-                    # 设置接收超时
-                    local_socket.settimeout(30)
-                    chunk = local_socket.recv(8192)  # 增加缓冲区大小
-                    
-                    if not chunk:
-                        logging.info(f"本地服务连接关闭，总共接收{len(response)}字节")
+            # 先发送状态码和头部，响应体随后分块转发，不在内存中缓存整个响应
+            response_data = self.build_response_data(local_response.status, local_response.getheaders())
+            self.send_success_response(request_id, response_data)
+            
+            seq = 0  # 分块序号
+            received = 0  # 已接收的字节数
+            stream_error = None
+            last_progress_time = time.monotonic()
+            
+            # 每次读取到同一个池化缓冲区中，读到即发
+            with borrow_buffer() as chunk, memoryview(chunk) as view:
+                while True:
+                    try:
+                        current_time = time.monotonic()
+                        elapsed = int(current_time - start_time)
+                        
+                        # 每30秒发送一次进度更新
+                        if current_time - last_progress_time > 30:
+                            self.send_progress_update(request_id, 
+                                f"任务运行中... 已耗时{elapsed}秒，已接收数据{received}字节")
+                            last_progress_time = current_time
+                        
+                        # 检查总运行时间
+                        if elapsed > 600:  # 10分钟总超时
+                            logging.warning("任务总超时，已运行%s秒", elapsed)
+                            stream_error = f"任务总超时，已运行{elapsed}秒"
+                            self.send_progress_update(request_id, stream_error)
+                            break
+                        
+                        # http.client负责处理Content-Length和chunked编码；readinto1有数据就返回，
+                        # 不等填满缓冲区，SSE、长轮询等慢速输出也能及时转发
+                        chunk_size = local_response.readinto1(view)
+                        
+                        if not chunk_size:
+                            logging.debug("本地服务响应接收完成，总共接收%s字节", received)
+                            # 有Content-Length时readinto1读完后不会结束响应，补一次read()让http.client关闭它
+                            local_response.read()
+                            # 响应完整读取且本地服务未要求关闭时，连接可以放回池中复用
+                            reusable = conn.sock is not None and local_response.isclosed()
+                            break
+                        received += chunk_size
+                        
+                        if not self.send_response_chunk(request_id, seq, view[:chunk_size]):
+                            stream_error = "发送响应分块失败"
+                            break
+                        seq += 1
+                        
+                    except socket.timeout:
+                        elapsed = int(time.monotonic() - start_time)
+                        logging.warning("等待本地服务数据超时，放弃等待，已运行%s秒", elapsed)
+                        stream_error = f"等待数据超时，已运行{elapsed}秒"
+                        self.send_progress_update(request_id, stream_error)
                         break
-                    response += chunk
-                    timeout_count = 0  # 收到数据后重置超时计数
-                    
-                except socket.timeout:
-                    elapsed = int(time.time() - start_time)
-                    timeout_count += 1
-                    
-                    if timeout_count >= max_timeouts:
-                        logging.warning(f"连续超时{max_timeouts}次，放弃等待，已运行{elapsed}秒")
-                        self.send_progress_update(request_id, f"连续超时{max_timeouts}次，已运行{elapsed}秒")
+                    except Exception as e:
+                        logging.error("接收数据时出错: %s", e)
+                        stream_error = f"接收数据时出错: {e}"
                         break
-                    else:
-                        logging.debug(f"等待数据中... 已运行{elapsed}秒 (超时次数: {timeout_count}/{max_timeouts})")
-                        continue
-                except Exception as e:
-                    logging.error(f"接收数据时出错: {e}")
-                    break
             
-            # 任务完成
-            elapsed = int(time.time() - start_time)
-            data_size = len(response)
-            self.send_progress_update(request_id, f"任务完成，耗时{elapsed}秒，接收{data_size}字节")
+            # 发送最后一个空分块，通知服务器响应结束
+            self.send_response_chunk(request_id, seq, b'', final=True, error=stream_error)
             
-            if not response:
-                logging.warning("本地服务没有返回响应")
-                self.send_error_response(request_id, "本地服务没有返回响应")
-                return
-            
-            # 解析HTTP响应
-            try:
-                http_response = self.parse_http_response(response)
-                self.send_success_response(request_id, http_response)
-            except Exception as e:
-                logging.error(f"解析HTTP响应错误: {e}")
-                response_data = {
-                    "status": 200,
-                    "headers": {"Content-Type": "text/plain"},
-                    "body": response.decode('utf-8', errors='replace')
-                }
-                self.send_success_response(request_id, response_data)
+            # 任务完成
+            elapsed = int(time.monotonic() - start_time)
+            self.send_progress_update(request_id, f"任务完成，耗时{elapsed}秒，接收{received}字节")
             
         except socket.error as e:
-            logging.error(f"连接本地服务错误: {e}")
+            logging.error("连接本地服务错误: %s", e)
             self.send_error_response(request_id, f"连接本地服务错误: {str(e)}")
+        except http.client.HTTPException as e:
+            logging.error("本地服务响应格式错误: %s", e)
+            self.send_error_response(request_id, f"本地服务响应格式错误: {str(e)}")
         except Exception as e:
-            logging.error(f"处理请求 {request_id} 错误: {e}", exc_info=True)
+            logging.error("处理请求 %s 错误: %s", request_id, e, exc_info=traceback_allowed("handle_request"))
             self.send_error_response(request_id, str(e))
         finally:
-            # 确保本地socket被正确关闭
-            if local_socket:
+            # 可复用的连接放回连接池，否则关闭
+            if conn:
+                self._release_local_connection(conn, reusable)
+    
+    def _acquire_local_connection(self, fresh=False):
+        """从连接池获取到本地服务的连接，返回(连接, 是否为复用连接)"""
+        if not fresh:
+            while True:
                 try:
-                    local_socket.close()
-                except:
-                    pass
+                    conn, idle_since = self.local_connection_pool.get_nowait()
+                except queue.Empty:
+                    break
+                if time.monotonic() - idle_since < self.local_idle_timeout:
+                    return conn, True
+                # 空闲太久的连接很可能已被本地服务关闭，直接丢弃
+                conn.close()
+        
+        logging.debug("连接本地服务 %s:%s", self.local_host, self.local_port)
+        conn = LocalHTTPConnection(self.local_host, self.local_port, timeout=30)  # 连接超时30秒
+        conn.connect()
+        
+        # 禁用Nagle算法，小请求无需等待合并
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # 连接成功后设置更长的数据传输超时
+        conn.sock.settimeout(300)  # 5分钟数据传输超时
+        return conn, False
+    
+    def _release_local_connection(self, conn, reusable):
+        """归还到本地服务的连接，不可复用或连接池已满时关闭"""
+        if reusable:
+            try:
+                self.local_connection_pool.put_nowait((conn, time.monotonic()))
+                return
+            except queue.Full:
+                pass
+        try:
+            conn.close()
+        except:
+            pass
+    
+    def _send_local_request(self, conn, method, path, body, headers):
+        """发送请求到本地爬虫服务并等待响应头（Content-Length由http.client设置）"""
+        try:
+            conn.request(method, path, body=body or None, headers=headers)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            # 本地服务可能在读完请求体之前就返回了响应（例如拒绝请求），继续读取响应
+            logging.warning("发送请求时本地服务关闭了连接: %s，尝试读取已返回的响应", e)
+        
+        logging.debug("等待本地服务响应")
+        return conn.getresponse()
     
     
     def send_success_response(self, request_id, response_data):
@@ -618,102 +1102,75 @@ class TunnelClient:
             response_msg = {
                 "type": "response",
                 "request_id": request_id,
-                "data": json.dumps(response_data)
+                "data": response_data  # 直接嵌套对象，避免二次JSON编码
             }
             
             success = self.send_message(response_msg)
             if success:
-                logging.info(f"响应已发送: {request_id}")
+                logging.debug("响应已发送: %s", request_id)
             else:
-                logging.error(f"发送响应失败: {request_id}")
+                logging.error("发送响应失败: %s", request_id)
         except Exception as e:
-            logging.error(f"构建响应消息错误: {e}")
+            logging.error("构建响应消息错误: %s", e)
     
-    def send_error_response(self, request_id, error_message):
-        """发送错误响应"""
+    def send_error_response(self, request_id, error_message, status=502):
+        """发送错误响应，status为服务器返回给访问者的HTTP状态码"""
         try:
             error_msg = {
                 "type": "error",
                 "request_id": request_id,
-                "error": error_message
+                "error": error_message,
+                "status": status
             }
             
             success = self.send_message(error_msg)
             if success:
-                logging.info(f"错误响应已发送: {request_id}")
+                logging.info("错误响应已发送: %s", request_id)
             else:
-                logging.error(f"发送错误响应失败: {request_id}")
+                logging.error("发送错误响应失败: %s", request_id)
         except Exception as e:
-            logging.error(f"构建错误响应消息错误: {e}")
+            logging.error("构建错误响应消息错误: %s", e)
     
-    def parse_http_response(self, response_bytes):
-        """解析HTTP响应"""
-        try:
-            # 分离头部和主体
-            if b'\r\n\r\n' in response_bytes:
-                headers_bytes, body = response_bytes.split(b'\r\n\r\n', 1)
-            else:
-                headers_bytes, body = response_bytes, b''
-                
-            headers_str = headers_bytes.decode('utf-8', errors='replace')
-            
-            # 解析状态行
-            status_line, *header_lines = headers_str.split('\r\n')
-            parts = status_line.split(' ', 2)
-            if len(parts) >= 2:
-                status_code = int(parts[1])
-            else:
-                status_code = 200
-            
-            # 解析头部
-            headers = {}
-            for line in header_lines:
-                if ':' in line:
-                    name, value = line.split(':', 1)
-                    headers[name.strip()] = value.strip()
-            
-            # 判断是否为二进制内容
-            content_type = headers.get('Content-Type', '').lower()
-            is_binary = any(binary_type in content_type for binary_type in [
-                'image/', 'video/', 'audio/', 'application/octet-stream',
-                'application/pdf', 'application/zip', 'font/'
-            ])
-            
-            # 构建响应对象
-            if is_binary:
-                # 对于二进制数据，使用base64编码
-                import base64
-                response_obj = {
-                    "status": status_code,
-                    "headers": headers,
-                    "body": base64.b64encode(body).decode('ascii'),
-                    "is_binary": True
-                }
-            else:
-                # 对于文本数据，正常解码
-                response_obj = {
-                    "status": status_code,
-                    "headers": headers,
-                    "body": body.decode('utf-8', errors='replace'),
-                    "is_binary": False
-                }
-            
-            return response_obj
-        except Exception as e:
-            logging.error(f"解析HTTP响应失败: {e}")
-            # 返回简单响应格式
-            return {
-                "status": 200,
-                "headers": {"Content-Type": "text/plain"},
-                "body": response_bytes.decode('utf-8', errors='replace'),
-                "is_binary": False
-            }
+    def send_response_chunk(self, request_id, seq, chunk, final=False, error=None):
+        """发送响应体分块，分块内容以length字节原始数据紧跟在消息头之后，final为True表示响应已结束"""
+        if not error:
+            # 常规分块直接填充字节模板
+            header = _RESPONSE_CHUNK_TEMPLATE % (
+                encode_json_value(request_id), seq, len(chunk), b'true' if final else b'false')
+            return self._send_frame_safe(header, chunk)
+        
+        chunk_msg = {
+            "type": "response_chunk",
+            "request_id": request_id,
+            "seq": seq,
+            "length": len(chunk),
+            "final": final,
+            "error": error
+        }
+        return self._send_message_safe(chunk_msg, chunk)
+    
+    def build_response_data(self, status_code, header_items):
+        """根据本地服务的响应头构建发送给服务器的响应对象（响应体通过response_chunk分块发送）"""
+        # http.client已解码chunked编码，不再转发传输相关的头部
+        headers = {
+            name: value for name, value in header_items
+            if name.lower() not in _HOP_BY_HOP_HEADERS
+        }
+        
+        return {
+            "status": status_code,
+            "headers": headers,
+            "streaming": True
+        }
     
     def stop(self):
         """优雅关闭客户端"""
         logging.info("正在停止客户端...")
         self.running = False
         self.shutdown_event.set()
+        self._disconnected.set()
+        self._wakeup_message_handler()
+        self._stop_writer_thread()
         
         # 等待线程结束
         if self.heartbeat_thread and self.heartbeat_thread.is_alive():
@@ -724,6 +1181,18 @@ class TunnelClient:
             logging.debug("等待消息处理线程结束...")
             self.message_handler_thread.join(timeout=3)
         
+        # 关闭请求线程池，不再接受新请求，排队中尚未开始的请求直接取消
+        self.request_executor.shutdown(wait=False, cancel_futures=True)
+        
+        # 关闭连接池中的本地连接
+        while True:
+            try:
+                self.local_connection_pool.get_nowait()[0].close()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+        
         # 关闭socket连接
         if self.control_socket:
             try:
@@ -735,56 +1204,24 @@ class TunnelClient:
         
         logging.info("客户端停止完成")
     
-    def _calculate_reconnect_delay(self):
-        """智能计算重连延迟时间"""
-        current_time = time.time()
-        
-        # 更积极的重连策略
-        if self.reconnect_attempts <= 5:
-            base_delay = min(self.reconnect_delay * (self.reconnect_attempts), 10)  # 2, 4, 6, 8, 10秒
-        elif self.reconnect_attempts <= 15:
-            base_delay = 15  # 6-15次失败后15秒
-        elif self.reconnect_attempts <= 30:
-            base_delay = 30  # 16-30次失败后30秒
-        elif self.reconnect_attempts <= 60:
-            base_delay = 60  # 31-60次失败后1分钟
-        else:
-            base_delay = 90  # 60次后固定90秒
-        
-        # 如果有成功连接历史，考虑调整策略
-        if self.last_successful_time and self.successful_connections > 0:
-            time_since_last_success = current_time - self.last_successful_time
-            
-            # 如果最近连接过（30分钟内），快速重连
-            if time_since_last_success < 1800:  # 30分钟
-                base_delay = min(base_delay, 10)
-                logging.debug(f"最近连接成功过，快速重连延迟{base_delay}秒")
-            # 如果1小时内连接过，中等延迟
-            elif time_since_last_success < 3600:  # 1小时
-                base_delay = min(base_delay, 20)
-                logging.debug(f"1小时内连接成功过，减少重连延迟至{base_delay}秒")
-            # 如果长时间没有连接成功（超过6小时），增加延迟
-            elif time_since_last_success > 21600:  # 6小时
-                base_delay = min(base_delay * 1.5, self.max_reconnect_delay)
-                logging.debug(f"长时间连接失败，增加重连延迟至{base_delay}秒")
-        
-        # 连接成功率调整
-        if self.successful_connections > 0:
-            failure_rate = self.reconnect_attempts / (self.successful_connections + self.reconnect_attempts)
-            if failure_rate > 0.8:  # 失败率超过80%
-                base_delay = min(base_delay * 1.5, self.max_reconnect_delay)
-                logging.debug(f"连接失败率较高({failure_rate:.2%})，增加延迟")
-        
-        return int(base_delay)
+    def _on_gc(self, phase, info):
+        """gc回调，统计各代自动回收次数"""
+        if phase == "stop":
+            self.gc_collections[info["generation"]] += 1
     
     def _perform_memory_cleanup(self):
-        """执行简单的内存清理"""
+        """内存明显增长时才执行完整回收，平时交给分代回收按分配压力自动进行"""
         try:
-            import gc
+            memory_mb = current_rss_mb()
+            if memory_mb is not None and memory_mb - self._last_memory_mb < self.memory_growth_threshold:
+                logging.debug("内存使用: %.1f MB，无需主动回收，各代回收次数: %s", memory_mb, self.gc_collections)
+                return
+            
             collected = gc.collect()
-            logging.debug(f"内存清理完成，清理{collected}个对象")
+            self._last_memory_mb = current_rss_mb() or 0.0
+            logging.debug("内存清理完成，清理%s个对象", collected)
         except Exception as e:
-            logging.debug(f"内存清理失败: {e}")
+            logging.debug("内存清理失败: %s", e)
 
 
 
@@ -801,11 +1238,11 @@ class TunnelClient:
             
             success = self.send_message(progress_msg)
             if success:
-                logging.info(f"进度更新已发送: {message}")
+                logging.debug("进度更新已发送: %s", message)
             else:
-                logging.warning(f"进度更新发送失败: {message}")
+                logging.warning("进度更新发送失败: %s", message)
         except Exception as e:
-            logging.error(f"发送进度更新错误: {e}")
+            logging.error("发送进度更新错误: %s", e)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="内网穿透客户端")
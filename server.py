@@ -6,21 +6,35 @@
 
 
 
+import atexit
 import socket
 import threading
 import json
 import ssl
 import uuid
+import queue
 import argparse
 import logging
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import time
 import os
-import requests  # 新增导入
-import select
+import errno
+import heapq
+import selectors
 import signal
+import subprocess
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+try:
+    import orjson  # 可选依赖，序列化速度更快
+except ImportError:
+    orjson = None
+
+try:
+    import psutil  # 可选依赖，用于记录内存使用
+except ImportError:
+    psutil = None
 
 # 配置日志轮转
 def setup_logging():
@@ -45,8 +59,27 @@ def setup_logging():
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # 写文件和控制台在后台线程完成，业务线程记录日志时只需放入队列，不会阻塞在文件写入和轮转上
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    
+    def stop_listener():
+        """退出时改为直接写入日志，再停止后台写日志线程，避免守护线程最后的日志丢失"""
+        # 一次性替换处理器列表：之后的日志直接写入，不会出现既不入队也无处理器的间隙
+        logger.handlers = [file_handler, console_handler]
+        # stop()会先写完队列中已有的日志
+        listener.stop()
+        # 替换前刚拿到旧处理器列表的线程可能在stop()之后才入队，这里补写
+        while True:
+            try:
+                listener.handle(log_queue.get_nowait())
+            except queue.Empty:
+                break
+    
+    atexit.register(stop_listener)
 
 # 初始化日志
 setup_logging()
@@ -57,6 +90,117 @@ if hasattr(sys.stdout, 'reconfigure'):
 elif hasattr(sys.stdout, 'buffer'):
     sys.stdout = open(sys.stdout.fileno(), mode='w', encoding='utf-8', buffering=1)
 
+# 固定格式的高频消息预先生成字节模板，只需填入时间戳，无需每次序列化字典
+_HEARTBEAT_RESPONSE_TEMPLATE = b'{"type":"heartbeat_response","timestamp":%.6f,"server_time":"%b"}\n'
+_PONG_TEMPLATE = b'{"type":"pong","timestamp":%.6f,"original_timestamp":%b}\n'
+_PING_TEMPLATE = b'{"type":"ping","timestamp":%.6f}\n'
+
+def encode_json_value(value):
+    """将单个值编码为JSON字节，用于填充字节模板"""
+    return json.dumps(value).encode('ascii')
+
+# 每个请求最多缓存的响应消息数（分块最大64KB，约4MB），以及队列满时控制线程的最长等待时间（秒）
+_RESPONSE_QUEUE_SIZE = 64
+_RESPONSE_QUEUE_PUT_TIMEOUT = 10
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_statm_fd = None  # /proc/self/statm的文件描述符，首次使用时打开；-1表示不可用
+_statm_lock = threading.Lock()
+
+def _close_statm():
+    """退出时关闭保持打开的/proc/self/statm"""
+    global _statm_fd
+    with _statm_lock:
+        if _statm_fd is not None and _statm_fd >= 0:
+            try:
+                os.close(_statm_fd)
+            except OSError:
+                pass
+        _statm_fd = -1
+
+def current_rss_mb():
+    """读取当前进程的常驻内存（MB），不支持/proc或读取失败时返回None"""
+    global _statm_fd
+    with _statm_lock:
+        if _statm_fd is None:
+            # 首次使用时打开并保持打开，之后每次用pread从头读取，不必重复open/close
+            try:
+                _statm_fd = os.open('/proc/self/statm', os.O_RDONLY)
+                atexit.register(_close_statm)
+            except OSError:
+                _statm_fd = -1
+        if _statm_fd < 0:
+            return None
+        try:
+            # statm第二个字段是常驻内存页数
+            return int(os.pread(_statm_fd, 64, 0).split()[1]) * _PAGE_SIZE / (1024 * 1024)
+        except (OSError, ValueError, IndexError, AttributeError):
+            # 读取失败（如/proc被卸载）后关闭并不再尝试，调用方改用其他方式
+            try:
+                os.close(_statm_fd)
+            except OSError:
+                pass
+            _statm_fd = -1
+            return None
+
+def probe_tcp_port(host, port, timeout):
+    """非阻塞connect探测端口是否在监听，返回连接耗时（秒）；被拒绝时抛出OSError，超时抛出socket.timeout"""
+    # Windows上非阻塞connect返回WSAEWOULDBLOCK，而不是EINPROGRESS
+    in_progress = {errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", None)}
+    last_error = None
+    # 和socket.create_connection一样依次尝试解析出的地址，IPv6地址也能探测
+    for family, socktype, proto, _, address in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(False)
+        selector = selectors.DefaultSelector()
+        try:
+            start = time.monotonic()
+            err = sock.connect_ex(address)
+            if err in in_progress:
+                # 等待连接完成，超时后立即放弃，不让监控线程卡在内核里
+                selector.register(sock, selectors.EVENT_WRITE)
+                if not selector.select(timeout):
+                    raise socket.timeout("连接超时")
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            return time.monotonic() - start
+        except OSError as e:
+            last_error = e
+        finally:
+            selector.close()
+            sock.close()
+    raise last_error if last_error is not None else OSError("无法解析地址: %s" % host)
+
+# 错误页面模板
+_ERROR_HTML_TEMPLATE = """
+<!DOCTYPE HTML>
+<html>
+    <head>
+        <meta charset="utf-8">
+        <title>错误 {code}</title>
+    </head>
+    <body>
+        <h1>错误 {code}</h1>
+        <p>{message}</p>
+        <p>{explain}</p>
+    </body>
+</html>
+"""
+
+if orjson:
+    def dumps_message(message):
+        """将消息序列化为以换行符结尾的字节串"""
+        return orjson.dumps(message) + b'\n'
+    
+    loads_message = orjson.loads
+else:
+    def dumps_message(message):
+        """将消息序列化为以换行符结尾的字节串"""
+        return json.dumps(message).encode('utf-8') + b'\n'
+    
+    loads_message = json.loads
+
 class TunnelServer:
     def __init__(self, bind_host, bind_port, http_port, use_ssl=True, cert_file=None, key_file=None):
         self.bind_host = bind_host
@@ -67,15 +211,23 @@ class TunnelServer:
         self.key_file = key_file
         self.tunnels = {}  # tunnel_id -> client_socket
         self.domain_tunnels = {}  # subdomain -> tunnel_id
-        self.pending_requests = {}  # request_id -> response_event, response_data
+        self.pending_requests = {}  # request_id -> 响应消息队列（响应头、响应体分块、错误）
         self.running = False
-        self.client_last_seen = {}  # 记录客户端最后活跃时间
+        self.client_last_seen = {}  # 记录客户端最后活跃时间（time.monotonic()，不受系统时间调整影响）
         self.heartbeat_timeout = 120  # 心跳超时时间（秒）2分钟
         self.current_connections = 0  # 改为实例变量
+        self.connections_lock = threading.Lock()  # 接受线程和各客户端线程都会修改连接计数
+        self.send_locks = {}  # client_socket -> 写锁，HTTP处理线程、控制线程和监控线程都会向同一隧道写入
+        # 控制端口和HTTP端口开始监听后分别设置，启动时据此判断服务器是否就绪
+        self.control_ready = threading.Event()
+        self.http_ready = threading.Event()
         self.timeout = 300  # 增加超时时间到5分钟
         self.shutdown_event = threading.Event()  # 优雅关闭事件
         self.http_server_instance = None
         self.control_server_socket = None
+        self.http_check_failures = 0  # HTTP服务器状态检查连续失败次数
+        # 当前进程的psutil句柄只创建一次，之后每次检查直接复用（仅在无法读取/proc时使用）
+        self.process = psutil.Process(os.getpid()) if psutil is not None else None
         
         # 注册信号处理器
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -111,7 +263,8 @@ class TunnelServer:
             logging.error(f"HTTP端口 {self.http_port} 已被占用，尝试释放...")
             try:
                 os.system(f"fuser -k {self.http_port}/tcp 2>/dev/null")
-                time.sleep(5)
+                if self.shutdown_event.wait(5):
+                    return False
             except:
                 pass
             
@@ -119,10 +272,6 @@ class TunnelServer:
                 logging.error("无法释放端口，服务器启动失败")
                 return False
         
-        # 启动各种监控服务
-        self._start_connection_monitor()
-        self._start_http_server_monitor() 
-        
         # 启动控制服务器（接受客户端连接）
         control_thread = threading.Thread(target=self.run_control_server, name="ControlServer")
         control_thread.daemon = True
@@ -133,7 +282,22 @@ class TunnelServer:
         http_thread.daemon = True
         http_thread.start()
         
-        logging.info("服务器启动完成")
+        # 等待两个端口都开始监听，成功时无需等待固定时间
+        # 控制服务器失败后不会重试（如端口被占用、证书无法加载），线程退出即视为启动失败
+        deadline = time.monotonic() + 10
+        while not self.control_ready.wait(0.1):
+            if not control_thread.is_alive() or time.monotonic() > deadline:
+                logging.error("控制服务器未能开始监听，服务器启动失败")
+                self.stop()
+                return False
+        
+        if self.http_ready.wait(10):
+            logging.info("服务器启动完成")
+        else:
+            logging.error("HTTP服务器未能在10秒内开始监听，后台将继续重试")
+        
+        # 端口就绪后再启动监控，避免第一次HTTP状态检查误报连接失败
+        self._start_monitor()
         
         # 主线程保持运行
         try:
@@ -147,38 +311,37 @@ class TunnelServer:
     def check_http_server_status(self):
         """检查HTTP服务器状态"""
         try:
-            # 构建检查URL - 使用一个简单的根路径请求
-            protocol = "https" if self.use_ssl else "http"
-            check_url = f"{protocol}://{self.bind_host}:{self.http_port}/"
-            
-            # 如果bind_host是0.0.0.0，使用localhost进行检查
+            # 如果bind_host是通配地址，使用本机地址进行检查
             if self.bind_host == "0.0.0.0":
-                check_url = f"{protocol}://localhost:{self.http_port}/"
+                check_host = "127.0.0.1"
+            elif self.bind_host == "::":
+                check_host = "::1"
+            else:
+                check_host = self.bind_host
             
-            # 发送健康检查请求
-            response = requests.get(check_url, timeout=10, verify=False)
+            # 只探测端口是否在监听，不发完整HTTP请求：单线程HTTP服务器正在处理长请求时也不会误判为故障
+            connect_time = probe_tcp_port(check_host, self.http_port, timeout=5)
             
-            # 只要能收到响应（无论状态码是什么），都表明HTTP服务器正在运行
             return {
                 "status": "运行中",
-                "response_code": response.status_code,
-                "response_time": response.elapsed.total_seconds(),
+                "response_code": None,
+                "response_time": connect_time,
                 "error": None
             }
                 
-        except requests.exceptions.ConnectionError:
+        except socket.timeout:
             return {
-                "status": "连接失败",
+                "status": "超时",
                 "response_code": None,
                 "response_time": None,
-                "error": "无法连接到HTTP服务器"
+                "error": "HTTP服务器响应超时"
             }
-        except requests.exceptions.Timeout:
+        except ConnectionError:
             return {
-                "status": "超时",
+                "status": "连接失败",
                 "response_code": None,
                 "response_time": None,
-                "error": "HTTP服务器响应超时"
+                "error": "无法连接到HTTP服务器"
             }
         except Exception as e:
             return {
@@ -188,55 +351,65 @@ class TunnelServer:
                 "error": str(e)
             }
     
-    def _start_http_server_monitor(self):
-        """启动HTTP服务器状态监控"""
-        def monitor_http_server():
-            logging.info("HTTP服务器状态监控已启动，每2分钟检查一次")
-            consecutive_failures = 0
+    def _check_http_server(self):
+        """检查一次HTTP服务器状态，连续失败3次时重启，返回距下次检查的秒数"""
+        try:
+            # 检查HTTP服务器状态
+            status_info = self.check_http_server_status()
+            
+            # 构建状态消息
+            status_msg = f"HTTP服务器状态检查 - 状态: {status_info['status']}"
+            
+            if status_info['response_code'] is not None:
+                status_msg += f", 响应码: {status_info['response_code']}"
+            
+            if status_info['response_time'] is not None:
+                status_msg += f", 响应时间: {status_info['response_time']:.3f}秒"
+            
+            if status_info['error']:
+                status_msg += f", 错误: {status_info['error']}"
+            
+            # 记录日志和处理失败
+            if status_info['status'] == "运行中":
+                logging.debug(status_msg)
+                self.http_check_failures = 0  # 重置失败计数
+            else:
+                logging.warning(status_msg)
+                self.http_check_failures += 1
+                
+                # 如果连续失败3次，尝试重启HTTP服务器
+                if self.http_check_failures >= 3:
+                    logging.error("HTTP服务器连续失败3次，尝试重启...")
+                    self.restart_http_server()
+                    self.http_check_failures = 0  # 重置计数
+            
+            return 120  # 2分钟后再次检查
+            
+        except Exception as e:
+            logging.error(f"HTTP服务器状态监控出错: {e}")
+            return 60
+    
+    def _start_monitor(self):
+        """启动监控线程，连接检查和HTTP服务器检查共用一个线程，按各自的下次执行时间调度"""
+        def run_monitor():
+            logging.info("监控线程已启动，连接检查每30秒一次，HTTP服务器状态检查每2分钟一次")
+            now = time.monotonic()
+            # 小顶堆：(下次执行时间, 任务名, 任务)，任务返回距下次执行的秒数
+            tasks = [
+                (now, "connections", self._check_connections),
+                (now, "http_server", self._check_http_server),
+            ]
+            heapq.heapify(tasks)
             
             while self.running and not self.shutdown_event.is_set():
-                try:
-                    # 检查HTTP服务器状态
-                    status_info = self.check_http_server_status()
-                    
-                    # 构建状态消息
-                    status_msg = f"HTTP服务器状态检查 - 状态: {status_info['status']}"
-                    
-                    if status_info['response_code'] is not None:
-                        status_msg += f", 响应码: {status_info['response_code']}"
-                    
-                    if status_info['response_time'] is not None:
-                        status_msg += f", 响应时间: {status_info['response_time']:.3f}秒"
-                    
-                    if status_info['error']:
-                        status_msg += f", 错误: {status_info['error']}"
-                    
-                    # 记录日志和处理失败
-                    if status_info['status'] == "运行中":
-                        logging.debug(status_msg)
-                        consecutive_failures = 0  # 重置失败计数
-                    else:
-                        logging.warning(status_msg)
-                        consecutive_failures += 1
-                        
-                        # 如果连续失败3次，尝试重启HTTP服务器
-                        if consecutive_failures >= 3:
-                            logging.error("HTTP服务器连续失败3次，尝试重启...")
-                            self.restart_http_server()
-                            consecutive_failures = 0  # 重置计数
-                    
-                    # 等待120秒（2分钟）或关闭事件
-                    if self.shutdown_event.wait(120):
-                        break
-                    
-                except Exception as e:
-                    error_msg = f"HTTP服务器状态监控出错: {e}"
-                    logging.error(error_msg)
-                    if self.shutdown_event.wait(60):
-                        break
+                deadline, name, task = tasks[0]
+                # 等到最早的任务到期，关闭时立即返回
+                if self.shutdown_event.wait(max(0, deadline - time.monotonic())):
+                    break
+                interval = task()
+                heapq.heapreplace(tasks, (time.monotonic() + interval, name, task))
         
-        # 启动监控线程
-        monitor_thread = threading.Thread(target=monitor_http_server, name="HttpMonitor")
+        monitor_thread = threading.Thread(target=run_monitor, name="Monitor")
         monitor_thread.daemon = True
         monitor_thread.start()
     
@@ -258,7 +431,6 @@ class TunnelServer:
             
             # 强制释放端口（Windows版本）
             try:
-                import subprocess
                 # 在Windows上查找并杀死占用端口的进程
                 result = subprocess.run(['netstat', '-ano'], capture_output=True, text=True)
                 for line in result.stdout.split('\n'):
@@ -274,8 +446,9 @@ class TunnelServer:
             except Exception as e:
                 logging.warning(f"端口释放操作失败: {e}")
             
-            # 等待更长时间确保端口完全释放
-            time.sleep(5)
+            # 等待更长时间确保端口完全释放（关闭时立即返回）
+            if self.shutdown_event.wait(5):
+                return
             
             # 检查端口是否可用
             max_retries = 10
@@ -285,7 +458,8 @@ class TunnelServer:
                     break
                 else:
                     logging.warning(f"端口 {self.http_port} 仍被占用，等待中... ({i+1}/{max_retries})")
-                    time.sleep(2)
+                    if self.shutdown_event.wait(2):
+                        return
             else:
                 logging.error(f"端口 {self.http_port} 在 {max_retries} 次尝试后仍无法使用")
                 return
@@ -317,12 +491,14 @@ class TunnelServer:
             server_socket.bind((self.bind_host, self.bind_port))
             server_socket.listen(10)  # 增加监听队列
             
-            logging.info(f"控制服务器运行在 {self.bind_host}:{self.bind_port}")
-            
             if self.use_ssl:
                 context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
                 context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file)
             
+            # 证书加载成功后才算就绪，证书缺失或无效时start()能发现启动失败
+            self.control_ready.set()
+            logging.info(f"控制服务器运行在 {self.bind_host}:{self.bind_port}")
+            
             # 添加连接计数和限制
             max_connections = 100  # 最大同时处理的连接数
             
@@ -335,18 +511,23 @@ class TunnelServer:
                         continue
                     
                     client_socket, client_address = server_socket.accept()
-                    logging.info(f"接受来自 {client_address} 的连接 (当前连接数: {self.current_connections+1}/{max_connections})")
-                    
                     # 增加当前连接计数
-                    self.current_connections += 1
+                    with self.connections_lock:
+                        self.current_connections += 1
+                        connection_count = self.current_connections
+                    logging.info("接受来自 %s 的连接 (当前连接数: %s/%s)", client_address, connection_count, max_connections)
+                    
+                    # 心跳响应、pong等控制消息都很小，禁用Nagle避免等待合并（握手前设置，握手也受益）
+                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     
                     if self.use_ssl:
                         try:
                             client_socket = context.wrap_socket(client_socket, server_side=True)
                         except ssl.SSLError as e:
-                            logging.error(f"SSL握手失败: {e}")
+                            logging.error("SSL握手失败: %s", e)
                             client_socket.close()
-                            self.current_connections -= 1
+                            with self.connections_lock:
+                                self.current_connections -= 1
                             continue
                     
                     # 设置客户端套接字的保活选项
@@ -369,8 +550,8 @@ class TunnelServer:
                     continue  # 超时继续循环检查关闭事件
                 except Exception as e:
                     if self.running and not self.shutdown_event.is_set():
-                        logging.error(f"接受连接错误: {e}")
-                        time.sleep(1)
+                        logging.error("接受连接错误: %s", e)
+                        self.shutdown_event.wait(1)
         except Exception as e:
             logging.error(f"控制服务器启动失败: {e}")
         finally:
@@ -383,22 +564,35 @@ class TunnelServer:
             
     def _handle_client_connection_wrapper(self, client_socket, client_address):
         """包装器函数，用于处理异常"""
+        self.send_locks[client_socket] = threading.Lock()
         try:
             self.handle_client_connection(client_socket, client_address)
         except Exception as e:
-            logging.error(f"处理客户端连接异常 {client_address}: {e}")
+            logging.error("处理客户端连接异常 %s: %s", client_address, e)
         finally:
-            self.current_connections -= 1
-            logging.info(f"连接 {client_address} 已断开，当前连接数: {self.current_connections}")
+            with self.connections_lock:
+                self.current_connections -= 1
+                connection_count = self.current_connections
+            logging.info("连接 %s 已断开，当前连接数: %s", client_address, connection_count)
+            self.send_locks.pop(client_socket, None)
             try:
                 client_socket.close()
             except:
                 pass
     
+    def send_to_tunnel(self, client_socket, data):
+        """向隧道连接写入一条完整消息；sendall可能分多次send，持锁保证消息头和原始数据不被其他线程的写入打断"""
+        lock = self.send_locks.get(client_socket)
+        if lock is None:
+            raise OSError("隧道连接已关闭")
+        with lock:
+            client_socket.sendall(data)
+    
     def handle_client_connection(self, client_socket, client_address):
         tunnel_id = None
         buffer = b''
-        last_activity = time.time()
+        raw_message = None  # 正在等待原始数据的消息头
+        last_activity = time.monotonic()
         
         try:
             # 设置更合理的超时时间
@@ -407,30 +601,30 @@ class TunnelServer:
             # 添加连接活跃度跟踪
             def update_activity():
                 nonlocal last_activity
-                last_activity = time.time()
+                last_activity = time.monotonic()
                 if tunnel_id:
                     self.client_last_seen[tunnel_id] = last_activity
             
-            logging.info(f"等待客户端 {client_address} 的初始数据...")
+            logging.info("等待客户端 %s 的初始数据...", client_address)
             
             initial_data = client_socket.recv(4096)
             if not initial_data:
-                logging.warning(f"客户端 {client_address} 连接后立即关闭")
+                logging.warning("客户端 %s 连接后立即关闭", client_address)
                 return
             
             # 快速识别HTTP请求并关闭连接
             if initial_data.startswith(b'GET ') or initial_data.startswith(b'POST ') or initial_data.startswith(b'HEAD '):
-                logging.warning(f"检测到HTTP请求，不是合法的控制连接: {client_address}")
+                logging.warning("检测到HTTP请求，不是合法的控制连接: %s", client_address)
                 client_socket.close()
                 return
             
-            logging.info(f"收到客户端 {client_address} 的初始数据: {len(initial_data)} 字节")
-            logging.debug(f"初始数据: {initial_data[:100].hex()}")
+            logging.info("收到客户端 %s 的初始数据: %s 字节", client_address, len(initial_data))
+            logging.debug("初始数据: %s", initial_data[:100].hex())
             
             # 尝试以UTF-8解码
             try:
                 decoded_data = initial_data.decode('utf-8')
-                logging.info(f"解码后的初始数据: {decoded_data.strip()}")
+                logging.info("解码后的初始数据: %s", decoded_data.strip())
                 
                 # 查找消息边界
                 if '\n' in decoded_data:
@@ -439,84 +633,133 @@ class TunnelServer:
                     
                     # 尝试解析JSON
                     try:
-                        json_data = json.loads(message)
-                        logging.info(f"解析初始JSON成功: {json_data}")
+                        json_data = loads_message(message)
+                        logging.info("解析初始JSON成功: %s", json_data)
                         
                         # 处理注册消息
                         if json_data.get('type') == 'register':
                             tunnel_id = json_data.get('tunnel_id')
                             self.tunnels[tunnel_id] = client_socket
-                            logging.info(f"客户端 {client_address} 成功注册为隧道 {tunnel_id}")
+                            logging.info("客户端 %s 成功注册为隧道 %s", client_address, tunnel_id)
                             
                             # 处理子域名
                             if 'subdomain' in json_data:
                                 subdomain = json_data.get('subdomain')
                                 self.register_subdomain(subdomain, tunnel_id)
-                                logging.info(f"注册子域名 {subdomain} 到隧道 {tunnel_id}")
+                                logging.info("注册子域名 %s 到隧道 %s", subdomain, tunnel_id)
+                            
+                            # 发送确认消息，客户端收到后才开始发送心跳
+                            confirmation = {
+                                "type": "register_confirm",
+                                "tunnel_id": tunnel_id,
+                                "status": "success"
+                            }
+                            self.send_to_tunnel(client_socket, dumps_message(confirmation))
+                            logging.info("已发送注册确认消息给隧道 %s", tunnel_id)
                         else:
-                            logging.warning(f"初始消息不是注册消息: {json_data.get('type')}")
+                            logging.warning("初始消息不是注册消息: %s", json_data.get('type'))
                     except json.JSONDecodeError as e:
-                        logging.error(f"初始JSON解析错误: {e}, 消息内容: {message}")
+                        logging.error("初始JSON解析错误: %s, 消息内容: %s", e, message)
                         buffer = initial_data  # 保留原始数据
                 else:
-                    logging.warning(f"初始数据中没有换行符，无法解析")
+                    logging.warning("初始数据中没有换行符，无法解析")
                     buffer = initial_data  # 保留原始数据
             except UnicodeDecodeError:
-                logging.error(f"无法解码初始数据为UTF-8，可能不是文本数据")
+                logging.error("无法解码初始数据为UTF-8，可能不是文本数据")
                 if initial_data.startswith(b'\x16\x03'):
-                    logging.error(f"检测到SSL/TLS握手，但服务器运行在非SSL模式")
+                    logging.error("检测到SSL/TLS握手，但服务器运行在非SSL模式")
                 buffer = initial_data  # 保留原始数据
             
             # 恢复正常超时设置
             client_socket.settimeout(None)
             
-            logging.info(f"进入消息处理主循环，当前buffer大小: {len(buffer)} 字节")
+            logging.info("进入消息处理主循环，当前buffer大小: %s 字节", len(buffer))
+            
+            # 使用bytearray缓冲区和读取偏移，避免每条消息都复制剩余数据
+            buffer = bytearray(buffer)
+            start = 0  # 未处理数据的起始位置
+            # 预分配的接收缓冲区，recv_into直接写入，不再每次recv都新建bytes对象
+            recv_buffer = bytearray(65536)
+            recv_view = memoryview(recv_buffer)
             
             # 主循环
             while self.running and tunnel_id in self.tunnels:
                 try:
-                    data = client_socket.recv(4096)
-                    if not data:
+                    received = client_socket.recv_into(recv_view)
+                    if not received:
                         break
                     
                     update_activity()  # 更新活跃时间
                     
-                    logging.debug(f"收到数据: {len(data)} 字节")
-                    buffer += data
+                    logging.debug("收到数据: %s 字节", received)
+                    
+                    # 已处理的数据超过一半时才丢弃，分摊移动开销
+                    if start and start >= len(buffer) // 2:
+                        del buffer[:start]
+                        start = 0
+                    buffer += recv_view[:received]
                     
                     # 处理可能的多条消息
-                    while b'\n' in buffer:
-                        message, buffer = buffer.split(b'\n', 1)
-                        if message:
+                    while True:
+                        if raw_message is not None:
+                            # 消息头之后紧跟length字节的原始数据，收齐后再处理
+                            end = start + raw_message["length"]
+                            if len(buffer) < end:
+                                break
+                            raw_message["payload"] = bytes(buffer[start:end])
+                            start = end
+                            message, raw_message = raw_message, None
+                        else:
+                            # 每条消息只扫描一次
+                            newline = buffer.find(b'\n', start)
+                            if newline < 0:
+                                break
+                            line = buffer[start:newline]
+                            start = newline + 1
+                            if not line:
+                                continue
                             try:
-                                # 尝试以UTF-8解码
-                                decoded_message = message.decode('utf-8')
-                                logging.debug(f"处理消息: {decoded_message[:100]}")
-                                self.process_client_message(client_socket, decoded_message, client_address)
-                            except UnicodeDecodeError:
-                                logging.error(f"无法解码消息")
-                                logging.debug(f"消息前20字节: {message[:20].hex()}")
+                                # 直接解析字节，省去一次UTF-8解码和字符串拷贝
+                                message = loads_message(line)
+                            except ValueError as e:
+                                # JSONDecodeError和UnicodeDecodeError都是ValueError的子类
+                                logging.error("解析客户端消息失败: %s", e)
+                                logging.debug("消息前20字节: %s", bytes(line[:20]).hex())
+                                continue
+                            if not isinstance(message, dict):
+                                # 合法JSON但不是对象（如[]、1），跳过该行，不影响整个隧道
+                                logging.error("客户端消息不是JSON对象，已忽略: %r", bytes(line[:20]))
+                                continue
+                            if message.get("length"):
+                                raw_message = message
+                                continue
+                        
+                        self.process_client_message(client_socket, message, client_address)
+                    
+                    # 数据已全部处理完，直接清空缓冲区
+                    if start == len(buffer):
+                        buffer.clear()
+                        start = 0
                 except socket.timeout:
                     # 检查是否长时间无活动
-                    if time.time() - last_activity > 120:  # 2分钟无活动
-                        logging.warning(f"客户端 {tunnel_id} 长时间无活动，断开连接")
+                    if time.monotonic() - last_activity > 120:  # 2分钟无活动
+                        logging.warning("客户端 %s 长时间无活动，断开连接", tunnel_id)
                         break
                     continue
                 except Exception as e:
-                    logging.error(f"接收数据错误: {e}")
+                    logging.error("接收数据错误: %s", e)
                     break
         
         except Exception as e:
-            logging.error(f"处理客户端连接错误: {e}")
+            logging.error("处理客户端连接错误: %s", e)
         
         finally:
             # 清理连接
             if tunnel_id:
                 self.cleanup_tunnel(tunnel_id)
     
-    def process_client_message(self, client_socket, message_str, client_address):
+    def process_client_message(self, client_socket, message, client_address):
         try:
-            message = json.loads(message_str)
             message_type = message.get("type")
             
             if message_type == "register":
@@ -524,18 +767,18 @@ class TunnelServer:
                 
                 # 如果隧道已存在，先清理旧连接
                 if tunnel_id in self.tunnels:
-                    logging.warning(f"隧道 {tunnel_id} 已存在，清理旧连接")
+                    logging.warning("隧道 %s 已存在，清理旧连接", tunnel_id)
                     self.cleanup_tunnel(tunnel_id)
                 
                 # 注册新连接
                 self.tunnels[tunnel_id] = client_socket
-                self.client_last_seen[tunnel_id] = time.time()
-                logging.info(f"客户端 {client_address} 注册为隧道 {tunnel_id}")
+                self.client_last_seen[tunnel_id] = time.monotonic()
+                logging.info("客户端 %s 注册为隧道 %s", client_address, tunnel_id)
                 
                 if "subdomain" in message:
                     subdomain = message["subdomain"]
                     self.register_subdomain(subdomain, tunnel_id)
-                    logging.info(f"为隧道 {tunnel_id} 注册子域名 {subdomain}")
+                    logging.info("为隧道 %s 注册子域名 %s", tunnel_id, subdomain)
                 
                 # 发送确认消息
                 try:
@@ -544,13 +787,10 @@ class TunnelServer:
                         "tunnel_id": tunnel_id,
                         "status": "success"
                     }
-                    client_socket.sendall((json.dumps(confirmation) + '\n').encode('utf-8'))
-                    logging.info(f"已发送注册确认消息给隧道 {tunnel_id}")
+                    self.send_to_tunnel(client_socket, dumps_message(confirmation))
+                    logging.info("已发送注册确认消息给隧道 %s", tunnel_id)
                 except Exception as e:
-                    logging.error(f"发送注册确认消息失败: {e}")
-                
-                # 启动心跳线程
-                self.start_heartbeat(client_socket, tunnel_id)
+                    logging.error("发送注册确认消息失败: %s", e)
                 
             elif message_type == "heartbeat":
                 # 增加详细的心跳处理日志
@@ -561,21 +801,17 @@ class TunnelServer:
                         break
                 
                 if tunnel_id:
-                    logging.info(f"收到隧道 {tunnel_id} 的心跳消息，时间戳: {message.get('timestamp', 'N/A')}")
+                    logging.info("收到隧道 %s 的心跳消息，时间戳: %s", tunnel_id, message.get('timestamp', 'N/A'))
                     # 更新最后活跃时间
-                    self.client_last_seen[tunnel_id] = time.time()
+                    self.client_last_seen[tunnel_id] = time.monotonic()
                     
                     # 发送心跳响应
-                    heartbeat_response = {
-                        "type": "heartbeat_response", 
-                        "timestamp": time.time(),
-                        "server_time": time.strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    response_json = json.dumps(heartbeat_response) + '\n'
-                    client_socket.sendall(response_json.encode('utf-8'))
-                    logging.info(f"向隧道 {tunnel_id} 发送心跳响应")
+                    now = time.time()
+                    self.send_to_tunnel(client_socket, _HEARTBEAT_RESPONSE_TEMPLATE % (
+                        now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)).encode('ascii')))
+                    logging.info("向隧道 %s 发送心跳响应", tunnel_id)
                 else:
-                    logging.warning(f"收到未知连接的心跳消息: {client_address}")
+                    logging.warning("收到未知连接的心跳消息: %s", client_address)
                 
             elif message_type == "ping":
                 # 增加详细的ping处理日志
@@ -586,21 +822,16 @@ class TunnelServer:
                         break
                 
                 if tunnel_id:
-                    logging.info(f"收到隧道 {tunnel_id} 的ping消息，时间戳: {message.get('timestamp', 'N/A')}")
+                    logging.info("收到隧道 %s 的ping消息，时间戳: %s", tunnel_id, message.get('timestamp', 'N/A'))
                     # 更新最后活跃时间
-                    self.client_last_seen[tunnel_id] = time.time()
+                    self.client_last_seen[tunnel_id] = time.monotonic()
                     
                     # 发送pong响应
-                    pong_response = {
-                        "type": "pong", 
-                        "timestamp": time.time(),
-                        "original_timestamp": message.get('timestamp')
-                    }
-                    response_json = json.dumps(pong_response) + '\n'
-                    client_socket.sendall(response_json.encode('utf-8'))
-                    logging.info(f"向隧道 {tunnel_id} 发送pong响应")
+                    self.send_to_tunnel(client_socket, _PONG_TEMPLATE % (
+                        time.time(), encode_json_value(message.get('timestamp'))))
+                    logging.info("向隧道 %s 发送pong响应", tunnel_id)
                 else:
-                    logging.warning(f"收到未知连接的ping消息: {client_address}")
+                    logging.warning("收到未知连接的ping消息: %s", client_address)
                 
             elif message_type == "pong":
                 # 处理客户端的pong响应
@@ -616,31 +847,44 @@ class TunnelServer:
                     
                     if original_timestamp:
                         rtt = current_time - original_timestamp
-                        logging.info(f"收到隧道 {tunnel_id} 的pong响应，往返时间: {rtt:.3f}秒，原始时间戳: {original_timestamp}")
+                        logging.info("收到隧道 %s 的pong响应，往返时间: %.3f秒，原始时间戳: %s", tunnel_id, rtt, original_timestamp)
                     else:
-                        logging.info(f"收到隧道 {tunnel_id} 的pong响应，时间戳: {message.get('timestamp', 'N/A')}")
+                        logging.info("收到隧道 %s 的pong响应，时间戳: %s", tunnel_id, message.get('timestamp', 'N/A'))
                     
                     # 更新最后活跃时间
-                    self.client_last_seen[tunnel_id] = current_time
+                    self.client_last_seen[tunnel_id] = time.monotonic()
                     
                     # 如果有等待ping响应的记录，可以在这里处理
                     # 例如更新连接状态等
                     
                 else:
-                    logging.warning(f"收到未知连接的pong响应: {client_address}")
+                    logging.warning("收到未知连接的pong响应: %s", client_address)
             
-            elif message_type == "response" or message_type == "error":
+            elif message_type == "response" or message_type == "error" or message_type == "response_chunk":
                 request_id = message["request_id"]
-                if request_id in self.pending_requests:
-                    event, _ = self.pending_requests[request_id]
-                    self.pending_requests[request_id] = (event, message)
-                    event.set()
+                response_queue = self.pending_requests.get(request_id)
+                if response_queue is not None:
+                    try:
+                        # 队列满时短暂等待，把背压传给客户端；长时间无人读取则放弃该请求
+                        response_queue.put(message, timeout=_RESPONSE_QUEUE_PUT_TIMEOUT)
+                    except queue.Full:
+                        logging.warning("响应队列已满，放弃请求 (请求ID: %s)", request_id)
+                        # 清空队列后放入终止消息，仍在等待分块的HTTP处理线程立即结束，不会卡满5分钟
+                        self.discard_pending_request(request_id)
+                        response_queue.put_nowait({
+                            "type": "error",
+                            "request_id": request_id,
+                            "error": "响应队列已满，请求已放弃"
+                        })
                     if message_type == "error":
-                        logging.warning(f"收到客户端错误响应 (请求ID: {request_id}): {message.get('error', '未知错误')}")
-                    else:
-                        logging.info(f"收到客户端成功响应 (请求ID: {request_id})")
+                        logging.warning("收到客户端错误响应 (请求ID: %s): %s", request_id, message.get('error', '未知错误'))
+                    elif message_type == "response":
+                        logging.info("收到客户端成功响应 (请求ID: %s)", request_id)
+                elif message_type == "response_chunk":
+                    # 浏览器已断开或请求已放弃，剩余分块直接丢弃
+                    logging.debug("丢弃已结束请求的响应分块: %s", request_id)
                 else:
-                    logging.warning(f"收到未知请求ID的响应: {request_id}")
+                    logging.warning("收到未知请求ID的响应: %s", request_id)
             
             elif message_type == "progress":
                 # 新增：处理进度更新
@@ -648,21 +892,18 @@ class TunnelServer:
                 progress_message = message.get("message", "")
                 timestamp = message.get("timestamp", time.time())
                 
-                logging.info(f"爬虫进度更新 (请求ID: {request_id}): {progress_message}")
+                logging.info("爬虫进度更新 (请求ID: %s): %s", request_id, progress_message)
                 
                 # 更新请求的最后活动时间，防止超时
                 if request_id in self.pending_requests:
-                    event, _ = self.pending_requests[request_id]
                     # 这里可以记录进度，但不触发事件完成
-                    logging.debug(f"请求 {request_id} 仍在处理中，已更新活动时间")
+                    logging.debug("请求 %s 仍在处理中，已更新活动时间", request_id)
             
             else:
-                logging.warning(f"收到未知类型的消息: {message_type}")
+                logging.warning("收到未知类型的消息: %s", message_type)
         
-        except json.JSONDecodeError as e:
-            logging.error(f"解析客户端消息失败: {e}")
         except Exception as e:
-            logging.error(f"处理客户端消息错误: {e}")
+            logging.error("处理客户端消息错误: %s", e)
     
     def run_http_server(self):
         """运行HTTP服务器，支持自动重启"""
@@ -673,7 +914,8 @@ class TunnelServer:
             try:
                 # 创建HTTP服务器
                 server = self.create_http_server()
-                logging.info(f"HTTP服务器运行在 {self.bind_host}:{self.http_port}")
+                self.http_ready.set()
+                logging.info("HTTP服务器运行在 %s:%s", self.bind_host, self.http_port)
                 
                 # 保存服务器实例
                 self.http_server_instance = server
@@ -694,10 +936,9 @@ class TunnelServer:
             except OSError as e:
                 consecutive_failures += 1
                 if e.errno == 98 or e.errno == 10048:  # 端口被占用 (Linux/Windows)
-                    logging.error(f"HTTP端口被占用，尝试释放...")
+                    logging.error("HTTP端口被占用，尝试释放...")
                     # Windows版本的端口释放
                     try:
-                        import subprocess
                         result = subprocess.run(['netstat', '-ano'], capture_output=True, text=True)
                         for line in result.stdout.split('\n'):
                             if f':{self.http_port}' in line and 'LISTENING' in line:
@@ -706,32 +947,37 @@ class TunnelServer:
                                     pid = parts[-1]
                                     try:
                                         subprocess.run(['taskkill', '/F', '/PID', pid], check=True)
-                                        logging.info(f"已终止占用端口的进程 PID: {pid}")
+                                        logging.info("已终止占用端口的进程 PID: %s", pid)
                                     except subprocess.CalledProcessError:
                                         pass
                     except Exception:
                         pass
-                    time.sleep(5)
+                    if self.shutdown_event.wait(5):
+                        break
                 else:
-                    logging.error(f"HTTP服务器OSError: {e}")
-                    time.sleep(10)  # 增加等待时间
+                    logging.error("HTTP服务器OSError: %s", e)
+                    if self.shutdown_event.wait(10):  # 增加等待时间
+                        break
                 
             except Exception as e:
                 consecutive_failures += 1
-                logging.error(f"HTTP服务器异常: {e}")
-                time.sleep(10)  # 增加等待时间
+                logging.error("HTTP服务器异常: %s", e)
+                if self.shutdown_event.wait(10):  # 增加等待时间
+                    break
             
             # 检查连续失败次数
             if consecutive_failures >= max_consecutive_failures:
-                logging.error(f"HTTP服务器连续失败{consecutive_failures}次，暂停重启60秒")
-                time.sleep(60)  # 等待60秒后重置计数
+                logging.error("HTTP服务器连续失败%s次，暂停重启60秒", consecutive_failures)
+                if self.shutdown_event.wait(60):  # 等待60秒后重置计数
+                    break
                 consecutive_failures = 0
             
             # 如果不是正常关闭，等待一段时间后重启
             if self.running:
                 wait_time = min(5 + consecutive_failures * 2, 30)  # 递增等待时间
-                logging.info(f"等待{wait_time}秒后重启HTTP服务器...")
-                time.sleep(wait_time)
+                logging.info("等待%s秒后重启HTTP服务器...", wait_time)
+                if self.shutdown_event.wait(wait_time):
+                    break
         
         logging.info("HTTP服务器线程退出")
     
@@ -757,7 +1003,7 @@ class TunnelServer:
                 
                 # 首先检查Host头部,处理子域名
                 host = self.headers.get('Host', '')
-                logging.info(f"收到请求: Host={host}, Path={self.path}")
+                logging.info("收到请求: Host=%s, Path=%s", host, self.path)
                 
                 # 解析子域名
                 subdomain = None
@@ -765,25 +1011,25 @@ class TunnelServer:
                     parts = host.split('.')
                     if len(parts) >= 2:  # 支持 p.windy.run 格式
                         subdomain = parts[0]
-                        logging.info(f"解析到子域名: {subdomain}")
+                        logging.info("解析到子域名: %s", subdomain)
                 
                 # 在日志中输出当前所有子域名映射，用于调试
-                logging.info(f"当前子域名映射: {tunnel_server.domain_tunnels}")
+                logging.info("当前子域名映射: %s", tunnel_server.domain_tunnels)
                 
                 # 如果存在子域名映射,直接使用对应的隧道ID
                 if subdomain and subdomain in tunnel_server.domain_tunnels:
                     tunnel_id = tunnel_server.domain_tunnels[subdomain]
-                    logging.info(f"通过子域名 {subdomain} 找到隧道 {tunnel_id}")
+                    logging.info("通过子域名 %s 找到隧道 %s", subdomain, tunnel_id)
                     # 子域名方式访问，路径保持不变
                     remaining_path = self.path
                 else:
                     if subdomain:
-                        logging.warning(f"子域名 {subdomain} 没有对应的隧道映射")
+                        logging.warning("子域名 %s 没有对应的隧道映射", subdomain)
                     
                     # 传统方式：从路径中提取隧道ID
                     path_parts = self.path.split('/')
                     if len(path_parts) < 2 or not path_parts[1]:  # 检查是否为空
-                        logging.warning(f"请求没有指定隧道ID: {self.path}")
+                        logging.warning("请求没有指定隧道ID: %s", self.path)
                         self.send_error(404, "隧道ID未指定")
                         return
                     
@@ -792,11 +1038,11 @@ class TunnelServer:
                 
                 # 检查隧道是否存在
                 if tunnel_id not in tunnel_server.tunnels:
-                    logging.warning(f"请求的隧道不存在: {tunnel_id}")
+                    logging.warning("请求的隧道不存在: %s", tunnel_id)
                     self.send_error(404, f"隧道 {tunnel_id} 不存在或未连接")
                     return
                 
-                logging.info(f"处理到隧道 {tunnel_id} 的请求, 路径: {remaining_path}")
+                logging.info("处理到隧道 %s 的请求, 路径: %s", tunnel_id, remaining_path)
                 
                 # 读取请求体
                 content_length = int(self.headers.get('Content-Length', 0))
@@ -815,78 +1061,72 @@ class TunnelServer:
                 request_data = {
                     "method": self.command,
                     "path": remaining_path,
-                    "headers": headers,  # 使用修正后的headers
-                    "body": body.decode('utf-8', errors='replace') if body else ""
+                    "headers": headers  # 使用修正后的headers
                 }
                 
                 # 在发送请求前记录开始时间
-                start_time = time.time()
-                logging.info(f"开始爬虫任务 (请求ID: {tunnel_id})")
+                start_time = time.monotonic()
+                logging.info("开始爬虫任务 (请求ID: %s)", tunnel_id)
                 
                 # 发送请求到客户端并等待响应
-                response = tunnel_server.forward_request_to_client(tunnel_id, request_data)
+                response = tunnel_server.forward_request_to_client(tunnel_id, request_data, body)
                 
                 if response:
-                    elapsed = time.time() - start_time
-                    logging.info(f"爬虫任务完成 (请求ID: {tunnel_id})，耗时: {elapsed:.1f}秒")
+                    elapsed = time.monotonic() - start_time
+                    logging.info("爬虫任务完成 (请求ID: %s)，耗时: %.1f秒", tunnel_id, elapsed)
                     # 处理响应
                     if response["type"] == "error":
                         error_msg = response.get("error", "内网服务错误")
-                        logging.error(f"收到错误响应: {error_msg}")
-                        self.send_error(502, error_msg)
+                        logging.error("收到错误响应: %s", error_msg)
+                        self.send_error(response.get("status", 502), error_msg)
                         return
                     
                     # 解析响应内容
+                    headers_started = False
                     try:
-                        logging.info(f"收到响应数据，正在解析...")
-                        resp_data = json.loads(response["data"])
+                        logging.info("收到响应数据，正在解析...")
+                        resp_data = response["data"]
                         status_code = resp_data.get("status", 200)
                         headers = resp_data.get("headers", {})
-                        body = resp_data.get("body", "")
-                        is_binary = resp_data.get("is_binary", False)
-                        
-                        # 对于文本内容，确保Content-Type指定了字符集
-                        if not is_binary and "Content-Type" in headers and "charset" not in headers["Content-Type"]:
-                            if "text/html" in headers["Content-Type"]:
-                                headers["Content-Type"] = "text/html; charset=utf-8"
-                            elif "text/plain" in headers["Content-Type"]:
-                                headers["Content-Type"] = "text/plain; charset=utf-8"
                         
-                        # 发送响应
-                        logging.info(f"发送响应: 状态码 {status_code}, 二进制: {is_binary}")
+                        # 发送响应头
+                        logging.info("发送响应: 状态码 %s", status_code)
+                        headers_started = True
                         self.send_response(status_code)
                         for name, value in headers.items():
                             self.send_header(name, value)
                         self.end_headers()
                         
-                        if body:
-                            if is_binary:
-                                # 对于二进制数据，从base64解码后发送
-                                import base64
-                                binary_data = base64.b64decode(body)
-                                self.wfile.write(binary_data)
-                                logging.info(f"二进制响应体已发送，长度: {len(binary_data)}")
-                            else:
-                                # 对于文本数据，以UTF-8编码发送
-                                self.wfile.write(body.encode('utf-8', errors='replace'))
-                                logging.info(f"文本响应体已发送，长度: {len(body)}")
+                        # 响应体分块到达即写出，原样转发字节
+                        sent = 0
+                        for chunk in tunnel_server.iter_response_chunks(response["request_id"]):
+                            self.wfile.write(chunk)
+                            sent += len(chunk)
+                        logging.info("响应体已发送，长度: %s", sent)
                         
                     except Exception as e:
-                        logging.error(f"解析响应数据失败: {e}")
-                        # 如果无法解析JSON，则直接返回原始响应
-                        self.send_response(200)
-                        self.send_header("Content-Type", "text/plain; charset=utf-8")
-                        self.end_headers()
-                        self.wfile.write(("解析响应失败: " + str(e)).encode('utf-8'))
+                        if headers_started:
+                            # 响应头已开始写出（通常是浏览器断开），不能再发送第二份响应
+                            logging.error("发送响应失败: %s", e)
+                        else:
+                            logging.error("解析响应数据失败: %s", e)
+                            # 如果无法解析JSON，则直接返回原始响应
+                            self.send_response(200)
+                            self.send_header("Content-Type", "text/plain; charset=utf-8")
+                            self.end_headers()
+                            self.wfile.write(("解析响应失败: " + str(e)).encode('utf-8'))
+                    finally:
+                        # 无论响应体是否开始读取，都移除等待队列，后续分块不再堆积
+                        tunnel_server.discard_pending_request(response.get("request_id"))
                 else:
-                    elapsed = time.time() - start_time
-                    logging.warning(f"爬虫任务失败 (请求ID: {tunnel_id})，耗时: {elapsed:.1f}秒")
+                    elapsed = time.monotonic() - start_time
+                    logging.warning("爬虫任务失败 (请求ID: %s)，耗时: %.1f秒", tunnel_id, elapsed)
                     self.send_error(502, "无法从内网服务获取响应")
             
             def send_error(self, code, message=None, explain=None):
                 """自定义send_error方法以支持中文"""
                 # 记录错误消息
-                logging.error(f"错误: {message}")
+                logging.error("错误: %s", message)
                 
                 # 将非ASCII消息替换为ASCII消息（如果需要）
                 if message and not all(ord(c) < 128 for c in message):
@@ -901,20 +1141,11 @@ class TunnelServer:
                 self.end_headers()
                 
                 # 发送HTML内容
-                content = f"""
-                <!DOCTYPE HTML>
-                <html>
-                    <head>
-                        <meta charset="utf-8">
-                        <title>错误 {code}</title>
-                    </head>
-                    <body>
-                        <h1>错误 {code}</h1>
-                        <p>{message}</p>
-                        <p>{explain if explain else ""}</p>
-                    </body>
-                </html>
-                """
+                content = _ERROR_HTML_TEMPLATE.format(
+                    code=code,
+                    message=message,
+                    explain=explain if explain else ""
+                )
                 
                 self.wfile.write(content.encode('utf-8'))
             
@@ -922,11 +1153,11 @@ class TunnelServer:
                 """覆盖日志记录方法，防止IndexError"""
                 try:
                     if len(args) >= 3:
-                        logging.info(f"HTTP请求: {args[0]} {args[1]} {args[2]}")
+                        logging.info("HTTP请求: %s %s %s", args[0], args[1], args[2])
                     else:
-                        logging.info(f"HTTP日志: {format % args if args else format}")
+                        logging.info("HTTP日志: %s", format % args if args else format)
                 except Exception as e:
-                    logging.error(f"日志记录出错: {e}")
+                    logging.error("日志记录出错: %s", e)
         
         httpd = HTTPServer((self.bind_host, self.http_port), TunnelHttpHandler)
         httpd.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -936,59 +1167,101 @@ class TunnelServer:
             context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
             context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file)
             httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
-            logging.info(f"HTTPS服务器运行在 {self.bind_host}:{self.http_port}")
+            logging.info("HTTPS服务器运行在 %s:%s", self.bind_host, self.http_port)
         
         return httpd
     
-    def forward_request_to_client(self, tunnel_id, request_data):
+    def forward_request_to_client(self, tunnel_id, request_data, body=b''):
         client_socket = self.tunnels.get(tunnel_id)
         if not client_socket:
-            logging.error(f"找不到隧道 {tunnel_id} 的连接")
+            logging.error("找不到隧道 %s 的连接", tunnel_id)
             return None
         
         # 生成唯一请求ID
         request_id = str(uuid.uuid4())
         
-        # 创建事件对象来等待响应
-        response_event = threading.Event()
-        self.pending_requests[request_id] = (response_event, None)
+        # 创建队列来接收响应头和后续的响应体分块；限制长度，浏览器读得慢时不会无限堆积
+        response_queue = queue.Queue(maxsize=_RESPONSE_QUEUE_SIZE)
+        self.pending_requests[request_id] = response_queue
         
         try:
             # 发送请求到客户端
             request_msg = {
                 "type": "request",
                 "request_id": request_id,
-                "data": json.dumps(request_data)
+                "data": request_data  # 直接嵌套对象，避免二次JSON编码
             }
+            # 请求体以length字节原始数据紧跟在消息头之后
+            if body:
+                request_msg["length"] = len(body)
             
-            logging.info(f"发送请求到客户端 (隧道ID: {tunnel_id}, 请求ID: {request_id})")
-            message_json = json.dumps(request_msg) + '\n'
-            client_socket.sendall(message_json.encode('utf-8'))
+            logging.info("发送请求到客户端 (隧道ID: %s, 请求ID: %s)", tunnel_id, request_id)
+            # 消息头和请求体在同一次持锁写入中发出，心跳响应、ping等不会插入请求体中间
+            self.send_to_tunnel(client_socket, dumps_message(request_msg) + body)
             
             # 等待响应，针对爬虫程序延长超时时间
-            logging.info(f"等待客户端爬虫响应 (请求ID: {request_id})，最长等待5分钟")
-            if response_event.wait(300):  # 5分钟超时
-                logging.info(f"收到爬虫响应事件通知 (请求ID: {request_id})")
-                _, response = self.pending_requests.pop(request_id, (None, None))
-                if response:
-                    logging.info(f"收到客户端响应 (请求ID: {request_id}, 类型: {response.get('type')})")
-                    return response
-                else:
-                    logging.warning(f"响应数据为空 (请求ID: {request_id})")
-                    return None
-            else:
+            logging.info("等待客户端爬虫响应 (请求ID: %s)，最长等待5分钟", request_id)
+            try:
+                response = response_queue.get(timeout=300)  # 5分钟超时
+            except queue.Empty:
                 # 超时
-                logging.warning(f"等待客户端爬虫响应超时 (请求ID: {request_id}, 5分钟)")
+                logging.warning("等待客户端爬虫响应超时 (请求ID: %s, 5分钟)", request_id)
                 self.pending_requests.pop(request_id, None)
                 return None
+            
+            logging.info("收到客户端响应 (请求ID: %s, 类型: %s)", request_id, response.get('type'))
+            if response.get("type") != "response":
+                # 错误响应之后不会再有响应体分块
+                self.pending_requests.pop(request_id, None)
+            return response
                 
         except Exception as e:
-            logging.error(f"转发请求错误: {e}")
+            logging.error("转发请求错误: %s", e)
             self.pending_requests.pop(request_id, None)
             # 连接出错时清理隧道
             self.cleanup_tunnel(tunnel_id)
             return None
     
+    def discard_pending_request(self, request_id):
+        """移除请求的等待队列并清空其中的消息，让可能阻塞在put上的控制线程立即继续"""
+        response_queue = self.pending_requests.pop(request_id, None)
+        while response_queue is not None:
+            try:
+                response_queue.get_nowait()
+            except queue.Empty:
+                break
+    
+    def iter_response_chunks(self, request_id):
+        """按顺序产出客户端发来的响应体分块，直到收到最后一个分块"""
+        response_queue = self.pending_requests.get(request_id)
+        expected_seq = 0
+        try:
+            while response_queue is not None:
+                try:
+                    message = response_queue.get(timeout=300)  # 两个分块之间最长等待5分钟
+                except queue.Empty:
+                    logging.warning("等待响应分块超时 (请求ID: %s)", request_id)
+                    return
+                
+                if message.get("type") != "response_chunk":
+                    logging.warning("响应传输中断 (请求ID: %s): %s", request_id, message.get('error', '未知错误'))
+                    return
+                if message.get("seq") != expected_seq:
+                    logging.error("响应分块序号错误 (请求ID: %s)，期望 %s，收到 %s", request_id, expected_seq, message.get('seq'))
+                    return
+                expected_seq += 1
+                
+                payload = message.get("payload")
+                if payload:
+                    yield payload
+                
+                if message.get("final"):
+                    if message.get("error"):
+                        logging.warning("响应未完整接收 (请求ID: %s): %s", request_id, message['error'])
+                    return
+        finally:
+            self.discard_pending_request(request_id)
+    
     def stop(self):
         """优雅关闭服务器"""
         logging.info("正在停止服务器...")
@@ -1032,9 +1305,9 @@ class TunnelServer:
     # 添加一个新方法用于注册子域名
     def register_subdomain(self, subdomain, tunnel_id):
         self.domain_tunnels[subdomain] = tunnel_id
-        logging.info(f"子域名 {subdomain} 已映射到隧道 {tunnel_id}")
+        logging.info("子域名 %s 已映射到隧道 %s", subdomain, tunnel_id)
         # 打印当前所有子域名映射，用于调试
-        logging.info(f"当前子域名映射: {self.domain_tunnels}")
+        logging.info("当前子域名映射: %s", self.domain_tunnels)
 
 
 
@@ -1060,96 +1333,80 @@ class TunnelServer:
         
         return "".join(parts)
 
-    def _start_connection_monitor(self):
-        """启动连接监控"""
-        def monitor_connections():
-            while self.running and not self.shutdown_event.is_set():
-                try:
-                    current_time = time.time()
-                    
-                    # 清理僵尸连接
-                    dead_tunnels = []
-                    for tunnel_id, client_socket in list(self.tunnels.items()):
-                        last_seen = self.client_last_seen.get(tunnel_id, current_time)
-                        idle_time = current_time - last_seen
-                        
-                        # 检查是否有正在处理的请求
-                        has_pending_requests = any(
-                            req_id for req_id in self.pending_requests.keys()
-                            if req_id.startswith(tunnel_id)  # 简化检查
-                        )
-                        
-                        # 如果有正在处理的请求，延长检测时间
-                        timeout_threshold = 600 if has_pending_requests else self.heartbeat_timeout
+    def _check_connections(self):
+        """检查一次隧道连接，清理僵尸隧道并输出状态，返回距下次检查的秒数"""
+        try:
+            current_time = time.monotonic()
+            
+            # 清理僵尸连接
+            dead_tunnels = []
+            for tunnel_id, client_socket in list(self.tunnels.items()):
+                last_seen = self.client_last_seen.get(tunnel_id, current_time)
+                idle_time = current_time - last_seen
+                
+                # 检查是否有正在处理的请求
+                has_pending_requests = any(
+                    req_id for req_id in self.pending_requests.keys()
+                    if req_id.startswith(tunnel_id)  # 简化检查
+                )
+                
+                # 如果有正在处理的请求，延长检测时间
+                timeout_threshold = 600 if has_pending_requests else self.heartbeat_timeout
+                
+                if idle_time > timeout_threshold:
+                    try:
+                        # 尝试发送一个ping消息来检测连接
+                        ping_timestamp = time.time()  # 客户端原样带回，用于计算往返时间
+                        self.send_to_tunnel(client_socket, _PING_TEMPLATE % ping_timestamp)
+                        logging.debug("向隧道 %s 发送ping检测消息", tunnel_id)
                         
-                        if idle_time > timeout_threshold:
-                            try:
-                                # 尝试发送一个ping消息来检测连接
-                                ping_timestamp = current_time
-                                ping_msg = {"type": "ping", "timestamp": ping_timestamp}
-                                ping_json = json.dumps(ping_msg) + '\n'
-                                client_socket.sendall(ping_json.encode('utf-8'))
-                                logging.debug(f"向隧道 {tunnel_id} 发送ping检测消息")
-                                
-                                # 等待一小段时间让客户端响应
-                                time.sleep(2)
-                                
-                                # 检查是否有响应（通过检查最后活跃时间是否更新）
-                                new_last_seen = self.client_last_seen.get(tunnel_id, last_seen)
-                                if new_last_seen <= last_seen:
-                                    # 没有收到响应，可能是僵尸连接
-                                    logging.warning(f"检测到僵尸隧道: {tunnel_id} (ping无响应)")
-                                    dead_tunnels.append(tunnel_id)
-                                else:
-                                    logging.debug(f"隧道 {tunnel_id} ping检测正常")
-                                    
-                            except Exception as e:
-                                # 发送失败，标记为死连接
-                                logging.warning(f"检测到僵尸隧道: {tunnel_id} (ping发送失败: {e})")
-                                dead_tunnels.append(tunnel_id)
-                    
-                    # 清理僵尸连接
-                    for tunnel_id in dead_tunnels:
-                        self.cleanup_tunnel(tunnel_id)
-                    
-                    # 统计当前连接数
-                    connection_count = len(self.tunnels)
-                    if connection_count > 0:
-                        logging.info(f"当前活跃隧道数: {connection_count}")
+                        # 等待一小段时间让客户端响应，关闭时不再继续检测
+                        if self.shutdown_event.wait(2):
+                            break
                         
-                        # 列出所有活跃隧道（只在调试模式下显示详细信息）
-                        tunnel_info = []
-                        for tunnel_id in self.tunnels:
-                            last_seen = self.client_last_seen.get(tunnel_id, current_time)
-                            idle_time = current_time - last_seen
-                            if idle_time < 0 or idle_time > 365 * 24 * 3600:
-                                formatted_time = "未知"
-                                self.client_last_seen[tunnel_id] = current_time
-                            else:
-                                formatted_time = self.format_time_duration(idle_time)
-                            tunnel_info.append(f"{tunnel_id}(空闲{formatted_time})")
-                        logging.debug(f"活跃隧道: {', '.join(tunnel_info)}")
-                    
-                    # 检查系统资源
-                    try:
-                        import psutil
-                        process = psutil.Process(os.getpid())
-                        mem_info = process.memory_info()
-                        logging.debug(f"内存使用: {mem_info.rss / 1024 / 1024:.1f} MB")
-                    except ImportError:
-                        pass  # psutil不可用时跳过内存检查
-                    
-                    # 等待30秒或关闭事件（提高检测频率）
-                    if self.shutdown_event.wait(30):
-                        break
-                except Exception as e:
-                    logging.error(f"监控错误: {e}")
-                    if self.shutdown_event.wait(30):
-                        break
-        
-        monitor_thread = threading.Thread(target=monitor_connections, name="ConnectionMonitor")
-        monitor_thread.daemon = True
-        monitor_thread.start()
+                        # 检查是否有响应（通过检查最后活跃时间是否更新）
+                        new_last_seen = self.client_last_seen.get(tunnel_id, last_seen)
+                        if new_last_seen <= last_seen:
+                            # 没有收到响应，可能是僵尸连接
+                            logging.warning("检测到僵尸隧道: %s (ping无响应)", tunnel_id)
+                            dead_tunnels.append(tunnel_id)
+                        else:
+                            logging.debug("隧道 %s ping检测正常", tunnel_id)
+                            
+                    except Exception as e:
+                        # 发送失败，标记为死连接
+                        logging.warning("检测到僵尸隧道: %s (ping发送失败: %s)", tunnel_id, e)
+                        dead_tunnels.append(tunnel_id)
+            
+            # 清理僵尸连接
+            for tunnel_id in dead_tunnels:
+                self.cleanup_tunnel(tunnel_id)
+            
+            # 统计当前连接数
+            connection_count = len(self.tunnels)
+            if connection_count > 0:
+                logging.info("当前活跃隧道数: %s", connection_count)
+                
+                # 列出所有活跃隧道（只在调试模式下构建详细信息）
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    tunnel_info = []
+                    for tunnel_id in self.tunnels:
+                        idle_time = current_time - self.client_last_seen.get(tunnel_id, current_time)
+                        tunnel_info.append(f"{tunnel_id}(空闲{self.format_time_duration(idle_time)})")
+                    logging.debug("活跃隧道: %s", ', '.join(tunnel_info))
+            
+            # 检查系统资源（未开启调试日志时跳过；优先直接读/proc，其他平台用psutil）
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                memory_mb = current_rss_mb()
+                if memory_mb is None and self.process is not None:
+                    memory_mb = self.process.memory_info().rss / 1024 / 1024
+                if memory_mb is not None:
+                    logging.debug("内存使用: %.1f MB", memory_mb)
+            
+            return 30  # 30秒后再次检查（提高检测频率）
+        except Exception as e:
+            logging.error("监控错误: %s", e)
+            return 30
 
     def cleanup_tunnel(self, tunnel_id):
         """清理指定的隧道连接"""
@@ -1159,7 +1416,7 @@ class TunnelServer:
             except:
                 pass
             del self.tunnels[tunnel_id]
-            logging.info(f"已清理僵尸隧道: {tunnel_id}")
+            logging.info("已清理僵尸隧道: %s", tunnel_id)
         
         if tunnel_id in self.client_last_seen:
             del self.client_last_seen[tunnel_id]
@@ -1168,7 +1425,7 @@ class TunnelServer:
         for subdomain, tid in list(self.domain_tunnels.items()):
             if tid == tunnel_id:
                 del self.domain_tunnels[subdomain]
-                logging.info(f"已清理子域名映射: {subdomain} -> {tunnel_id}")
+                logging.info("已清理子域名映射: %s -> %s", subdomain, tunnel_id)
 
 
 if __name__ == "__main__":
@@ -1196,6 +1453,7 @@ if __name__ == "__main__":
     )
     
     try:
-        server.start()
+        if server.start() is False:
+            sys.exit(1)
     except KeyboardInterrupt:
         server.stop()